@@ -4,33 +4,32 @@ import dash_bootstrap_components as dbc
 from layout import app_layout
 from callback import callbacks
 from callback_normalization import callback_normalization
+import render
+import instrumentation
+import warmup
 
 ############################################################
 #  Default Value Set up
 ############################################################
-default_values = {
-    "offset_top":   40,
-    "offset_bottom":    40,
-    "offset_left":  40,
-    "offset_right": 40,
-    "band_width": 20,
-    "band_spacing": 10,
-    "lane_label_size": 16,
-    "mw_label_size": 16
-}
+default_values = render.default_values
 
 ############################################################
 # Set up
 ############################################################
 app = dash.Dash(external_stylesheets=[dbc.themes.BOOTSTRAP], title = "TPN Calculator")
 app.layout = app_layout(default_value=default_values)
-callbacks(app, default_values)
-callback_normalization(app, default_values)
+# The callbacks are timed (see instrumentation.py).
+instrumented_app = instrumentation.instrument(app)
+callbacks(instrumented_app, default_values)
+callback_normalization(instrumented_app, default_values)
 
 ############################################################
 # Run on server
 ############################################################
 server=app.server
+instrumentation.init_server(server)
+instrumentation.init_health_check(server)
+warmup.init_server(server)
 if __name__ == '__main__':
     # For debug Run.
     app.run(debug=True)
@@ -19,16 +19,16 @@ window.dash_clientside = Object.assign({}, window.dash_clientside, {
         },
 
         generate_button_disable: function(
-            draw_type, raw_data_table, normalized_data_table,
+            draw_type, raw_dataset, normalized_dataset,
             draw_mw_range_switch, draw_mw_range_min, draw_mw_range_max) 
         {
             // Data Empty Check
             if (draw_type === "as_is") {
-                if (!Array.isArray(raw_data_table) || raw_data_table.length === 0) {
+                if (raw_dataset == null || raw_dataset.n_rows === 0) {
                     return true;    // disable
                 }
             } else if (draw_type === "normalized_new") {
-                if (!Array.isArray(normalized_data_table) || normalized_data_table.length === 0) {
+                if (normalized_dataset == null || normalized_dataset.n_rows === 0) {
                     return true;    // disable
                 }
             }
@@ -89,6 +89,12 @@ window.dash_clientside = Object.assign({}, window.dash_clientside, {
                 return true;
             } 
             return false;
+        },
+        false_if_value_is_not_null: function(value) {
+            if (value == null) {
+                return true;
+            }
+            return false;
         }
     }
 });
@@ -0,0 +1,92 @@
+import os
+import time
+import functools
+import contextlib
+
+import config
+import warmup
+import cache_store
+
+############################################################
+#  Background jobs (Generate / Calculate)
+############################################################
+# With config.background_callbacks, the heavy callbacks run as Dash background callbacks on a local
+# diskcache (no external broker): the request returns at once, the browser polls the progress,
+# and the job is cancelled when the inputs in `cancel` change.
+# Otherwise the same functions run in the request, with a set_progress that does nothing.
+#
+# The jobs are started as separate processes. The number of jobs running at the same time is limited
+# to config.background_workers by slots kept in the diskcache (shared among gunicorn workers).
+job_cache = None
+manager = None
+if config.background_callbacks == True:
+    import diskcache
+    import psutil
+    from dash import DiskcacheManager
+
+    class JobManager(DiskcacheManager):
+        def call_job_fn(self, key, job_fn, args, context):
+            # Fork the job only when no warmup thread is running (see warmup.py).
+            warmup.done.wait()
+            return super().call_job_fn(key, job_fn, args, context)
+
+        def terminate_job(self, job):
+            # The job may exit while its child processes are listed (e.g. just after storing its result).
+            try:
+                super().terminate_job(job)
+            except psutil.NoSuchProcess:
+                pass
+
+    # The job results are pickled by diskcache, so the directory must be private (see cache_store.make_private_dir()).
+    cache_store.make_private_dir(config.render_cache_dir)
+    job_cache = diskcache.Cache(cache_store.make_private_dir(config.background_cache_dir))
+    # The results (e.g. the preview images) expire after an hour, or earlier with a shorter config.data_ttl.
+    manager = JobManager(job_cache, expire = 3600 if config.data_ttl == None else min(3600, config.data_ttl))
+
+def callback(_app, *dependencies, progress = None, cancel = None, running = None, **kwargs):
+    # Same as _app.callback(). The decorated function receives set_progress as the first argument.
+    def decorator(func):
+        if manager == None:
+            @functools.wraps(func)
+            def run_in_request(*args):
+                return func(lambda progress_value: None, *args)
+            return _app.callback(*dependencies, **kwargs)(run_in_request)
+        return _app.callback(*dependencies, background = True, manager = manager, interval = 500,
+                             progress = progress, cancel = cancel, running = running, **kwargs)(func)
+    return decorator
+
+def is_running(pid):
+    # A killed job may remain as a zombie until its parent reaps it.
+    try:
+        return psutil.Process(pid).status() != psutil.STATUS_ZOMBIE
+    except psutil.NoSuchProcess:
+        return False
+
+def acquire_worker_slot():
+    # Returns the key of the slot, or None if all slots are in use.
+    # The slot of a job killed by a cancel is released when its process is gone.
+    with job_cache.transact():
+        for i in range(config.background_workers):
+            key = "worker_slot_{}".format(i)
+            holder = job_cache.get(key)
+            if holder == None or not is_running(holder):
+                job_cache.set(key, os.getpid())
+                return key
+    return None
+
+@contextlib.contextmanager
+def worker_slot(on_wait = None):
+    # Wait for a free slot. on_wait() is called while waiting (e.g. to report the progress).
+    if job_cache == None:
+        yield
+        return
+    key = acquire_worker_slot()
+    while key == None:
+        if on_wait != None:
+            on_wait()
+        time.sleep(0.2)
+        key = acquire_worker_slot()
+    try:
+        yield
+    finally:
+        job_cache.delete(key)
@@ -1,16 +1,18 @@
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw
+import numpy as np
 import pandas as pd
+import glyph_cache
 
 class WesternBlotPlotUtil:
     def __init__(self, data, plot_sample_indices: list, mw_column_index = 0,
                  band_width: int = 20, band_spacing: int = 10, offset: int = 20, marker_molecular_weights = [],
                  label_font_size = 16, marker_font_size = 12,
                  plot_labels = []):
+        self.mw_column_index = mw_column_index
         self.set_data(data)
         self.set_plot_indices(plot_sample_indices)
         self.set_plot_labels(plot_labels)
         self.set_band_width(band_width, band_spacing)
-        self.mw_column_index = mw_column_index
         self.set_marker_molecular_weights(marker_molecular_weights)
 
         self.set_offset_uniform(offset)
@@ -18,8 +20,10 @@ class WesternBlotPlotUtil:
 
         self.image_size = None
         self.field_rectangle = None
+        self.resampled = False
 
         self.set_molecular_weight_range()  # Default value is None
+        self.set_field_height()  # Default value is None (one pixel per data point)
 
     def set_offset_uniform(self, offset): 
         self.offset_left = offset
@@ -44,11 +48,42 @@ class WesternBlotPlotUtil:
         self.mw_range_min = mw_range_min
         self.mw_range_max = mw_range_max
 
-    def calc_image_size(self, sorted_data):
+    def set_field_height(self, field_height = None, pooling = 'max'):
+        # If field_height is set and the data has more points, the data is resampled to field_height rows.
+        # pooling: 'max' (keeps the peaks) or 'mean'
+        if field_height != None and field_height < 1:
+            raise
+        if pooling not in ('max', 'mean'):
+            raise
+        self.field_height = field_height
+        self.pooling = pooling
+
+    def calc_field_height(self, data_length):
+        if self.field_height == None or data_length <= self.field_height:
+            return data_length
+        return self.field_height
+
+    def calc_field_row(self, row_index, data_length, field_height):
+        # Row of the field where the data point is drawn.
+        return row_index * field_height // data_length
+
+    def resample_rows(self, signal_matrix, field_height):
+        # Pool the rows of signal_matrix (rows * lanes) into field_height rows.
+        # Pooled row i covers the data points whose calc_field_row() is i.
+        data_length = len(signal_matrix)
+        if data_length <= field_height:
+            return signal_matrix
+        bin_starts = -(-np.arange(field_height) * data_length // field_height)
+        if self.pooling == 'mean':
+            bin_sums = np.add.reduceat(np.nan_to_num(signal_matrix), bin_starts, axis = 0, dtype = np.float64)
+            bin_lengths = np.diff(np.append(bin_starts, data_length))
+            return bin_sums / bin_lengths[:, np.newaxis]
+        return np.fmax.reduceat(signal_matrix, bin_starts, axis = 0)
+
+    def calc_image_size(self, data_length):
         n_lanes = len(self.plot_indices)
         band_width = self.band_width
         band_spacing = self.band_spacing
-        data_length = len(sorted_data)
         
         offset_left = self.offset_left
         offset_right = self.offset_right
@@ -56,10 +91,10 @@ class WesternBlotPlotUtil:
         offset_bottom = self.offset_bottom
         
         field_width = (band_width + band_spacing) * n_lanes + band_spacing
-        field_height = data_length
+        field_height = self.calc_field_height(data_length)
 
         image_width = field_width + offset_left + offset_right
-        image_height= data_length + offset_top + offset_bottom
+        image_height= field_height + offset_top + offset_bottom
 
         image_size = (image_width, image_height)
         field_rectangle = ((offset_left, offset_top), (offset_left + field_width, offset_top + field_height))
@@ -67,7 +102,15 @@ class WesternBlotPlotUtil:
 
 
     def set_data(self, data: pd.DataFrame):
-        self.data = data.copy()
+        # The data is not copied. It must not be modified after set_data().
+        self.data = data
+        self.layers = {}    # name -> (key, layer)
+        # Rows in the descending order of the molecular weights (same order as sort_values()),
+        # and the sorted molecular weights for the binary search.
+        mw_series = self.data.iloc[:, self.mw_column_index].reset_index(drop = True)
+        self.sort_order = mw_series.sort_values(ascending = False).index.to_numpy()
+        self.sorted_mw = mw_series.to_numpy(dtype = np.float64)[self.sort_order]
+        self.sorted_mw_negative = -self.sorted_mw   # ascending
 
 
     def set_plot_indices(self, plot_indices: list[int]):
@@ -118,167 +161,263 @@ class WesternBlotPlotUtil:
         signal_for_plot =  int(255 * (1 - signal_normalized))
         return signal_for_plot
 
+    def calc_normalized_signal_array(self, signal_raw_values, signal_upper_bound):
+        # Vectorized version of calc_normalized_signal.
+        # Values are truncated toward zero and clipped into 0-255 as ImageDraw does for 'L' images.
+        # NaN (missing value) is treated as no signal.
+        # Calculated in float64 in a single buffer.
+        # A zero upper bound (e.g. an all-zero panel of a composite) is not divided: the values stay <= 0 and become white.
+        signal_for_plot = np.minimum(signal_raw_values, signal_upper_bound, dtype = np.float64)
+        np.divide(signal_for_plot, signal_upper_bound, out = signal_for_plot, where = signal_upper_bound != 0)
+        np.subtract(1, signal_for_plot, out = signal_for_plot)
+        np.multiply(255, signal_for_plot, out = signal_for_plot)
+        np.trunc(signal_for_plot, out = signal_for_plot)
+        np.nan_to_num(signal_for_plot, copy = False, nan = 255)
+        np.clip(signal_for_plot, 0, 255, out = signal_for_plot)
+        return signal_for_plot.astype(np.uint8)
+
+    def rasterize_bands(self, canvas, gray_scale_matrix, field_origin):
+        # Draw all bands into the canvas (2-D uint8 array) at once. gray_scale_matrix: rows * lanes
+        # Each lane occupies [line_start_x, line_start_x + band_width] (both inclusive, same as ImageDraw.line).
+        (field_origin_x, field_origin_y) = field_origin
+        canvas_height, canvas_width = canvas.shape
+        row_start = min(field_origin_y, canvas_height)
+        row_end = min(field_origin_y + len(gray_scale_matrix), canvas_height)
+        if row_end <= row_start or len(self.plot_indices) == 0:
+            return canvas
+
+        for i_lane in range(len(self.plot_indices)):
+            line_start_x = i_lane * (self.band_width + self.band_spacing) + self.band_spacing + field_origin_x
+            line_end_x = min(line_start_x + self.band_width + 1, canvas_width)
+            if line_end_x <= line_start_x:
+                continue
+            canvas[row_start:row_end, line_start_x:line_end_x] = gray_scale_matrix[:row_end - row_start, i_lane, np.newaxis]
+        return canvas
+
 
     def molecular_weight_reorder(self):
-        mw_key = self.data.columns[self.mw_column_index]
         if isinstance(self.data, pd.DataFrame) and self.data.empty == False:
-            sorted_data = self.data.sort_values(by = mw_key, ascending = False).reset_index(drop = True)
+            sorted_data = self.data.take(self.sort_order).reset_index(drop = True)
             return sorted_data
         else:
             raise
 
-    def search_max_signal(self, plot_data):
+    def search_max_signal(self, signal_matrix):
+        # signal_matrix: rows * lanes. NaN is skipped.
         signal_max = 0
-        for i in self.plot_indices:
-            signal_max_in_lane = plot_data.iloc[:,i].max()
+        if len(signal_matrix) == 0:
+            return signal_max
+        for signal_max_in_lane in np.fmax.reduce(signal_matrix, axis = 0):
             signal_max = max(signal_max, signal_max_in_lane)
         return signal_max
     
-    def determine_mw_range_index(self, sorted_data):
+    def search_nearest_mw(self, mw, row_start = 0, row_end = None):
+        # Row of the molecular weight nearest to mw in the sorted rows [row_start, row_end), by binary search.
+        # Same as (mw_series - mw).abs().idxmin(): the first row if some rows are equally near, NaN is skipped.
+        sorted_mw = self.sorted_mw[row_start:row_end]
+        sorted_mw_negative = self.sorted_mw_negative[row_start:row_end]
+        # Rows before `above_end` have larger molecular weights than mw.
+        above_end = int(np.searchsorted(sorted_mw_negative, -mw, side = 'left'))
+        nearest_row = None
+        if 0 < above_end:
+            # First row of the same value as the nearest larger one
+            nearest_row = int(np.searchsorted(sorted_mw_negative, sorted_mw_negative[above_end - 1], side = 'left'))
+        if above_end < len(sorted_mw) and not np.isnan(sorted_mw[above_end]):
+            if nearest_row == None or abs(sorted_mw[above_end] - mw) < abs(sorted_mw[nearest_row] - mw):
+                nearest_row = above_end
+        if nearest_row == None:
+            raise
+        return row_start + nearest_row
+
+    def determine_mw_range_index(self):
         # Search the index correspond to specified molecular weight bound
-        mw_series_full = sorted_data.iloc[:, self.mw_column_index]
-        mw_min_in_data = mw_series_full[len(mw_series_full) - 1]
-        mw_max_in_data = mw_series_full[0]
+        data_length = len(self.sorted_mw)
+        mw_min_in_data = self.sorted_mw[data_length - 1]
+        mw_max_in_data = self.sorted_mw[0]
         
-        min_row_index = len(mw_series_full)
+        min_row_index = data_length
         if self.mw_range_min != None and mw_min_in_data < self.mw_range_min:
-            min_row_index = (mw_series_full - self.mw_range_min).abs().idxmin()
-            min_row_index = min(len(mw_series_full), min_row_index)
+            min_row_index = self.search_nearest_mw(self.mw_range_min)
+            min_row_index = min(data_length, min_row_index)
 
         max_row_index = 0
         if self.mw_range_max != None and self.mw_range_max < mw_max_in_data:
-            max_row_index = (mw_series_full - self.mw_range_max).abs().idxmin()
+            max_row_index = self.search_nearest_mw(self.mw_range_max)
 
         return max_row_index, min_row_index
 
 
-    def draw_bands(self, signal_max = None, draw_rectangle = True, draw_marker_line = False, write_text = False, write_label = False, rotate_label = False):
+    #----------------------------------------
+    # Layers
+    #----------------------------------------
+    # The image is composited from layers: labels (drawn on the white background), bands, frame and markers.
+    # Each layer is kept with the settings it depends on (key) and rebuilt only when they change,
+    # so e.g. a label-only change reuses the band raster.
+    def get_layer(self, name, key, build):
+        layer = self.layers.get(name)
+        if layer == None or layer[0] != key:
+            layer = (key, build())
+            self.layers[name] = layer
+        return layer[1]
+
+    def get_plot_matrix(self):
+        # Signals of the plotted columns in the sorted order (rows * lanes, C-contiguous).
+        # Kept in the dtype of the data (float32 or float64), other types are converted to float64.
+        def build():
+            columns = [self.data.iloc[:, i] for i in self.plot_indices]
+            dtype = np.result_type(*[x.dtype for x in columns]) if 0 < len(columns) else np.float64
+            if dtype not in (np.float32, np.float64):
+                dtype = np.float64
+            plot_matrix = np.empty((len(self.sort_order), len(columns)), dtype = dtype)
+            for j, column in enumerate(columns):
+                plot_matrix[:, j] = column.to_numpy()[self.sort_order]
+            return plot_matrix
+        return self.get_layer("plot_matrix", tuple(self.plot_indices), build)
+
+    def get_band_layer(self, sorted_rows, signal_max):
+        # Returns (gray scale matrix of the bands (rows * lanes), True if the data is resampled)
+        def build():
+            row_start, row_end = sorted_rows
+            signal_matrix = self.get_plot_matrix()[row_start:row_end]   # view
+            signal_max_ = signal_max
+            if signal_max_ == None:
+                signal_max_ = self.search_max_signal(signal_matrix)
+            data_length = row_end - row_start
+            field_height = self.calc_field_height(data_length)
+            signal_matrix = self.resample_rows(signal_matrix, field_height)
+            return self.calc_normalized_signal_array(signal_matrix, signal_max_), field_height < data_length
+        key = (sorted_rows, tuple(self.plot_indices), signal_max, self.field_height, self.pooling)
+        return self.get_layer("bands", key, build)
+
+    def get_label_layer(self, write_label, rotate_label):
+        # White image with the lane labels
+        def build():
+            im_ = Image.new('L', self.image_size, color = 255)
+            if write_label == True:
+                self.draw_labels(im_, rotate_label)
+            return im_
+        key = (self.image_size, self.field_rectangle, write_label, rotate_label, tuple(self.plot_labels),
+               len(self.plot_indices), self.band_width, self.band_spacing, self.label_font_size)
+        return self.get_layer("labels", key, build)
+
+    def get_marker_layer(self, sorted_rows, draw_marker_line, write_text):
+        # Returns (mask of the marker lines and texts, its position in the image), or None if nothing is drawn.
+        def build():
+            if draw_marker_line == False and write_text == False:
+                return None
+            mask = Image.new('L', self.image_size, color = 0)
+            self.draw_markers(mask, sorted_rows, draw_marker_line, write_text)
+            bbox = mask.getbbox()
+            if bbox == None:
+                return None
+            return mask.crop(bbox), bbox
+        key = (sorted_rows, self.image_size, self.field_rectangle, draw_marker_line, write_text,
+               tuple(self.marker_molecular_weights), self.marker_font_size)
+        return self.get_layer("markers", key, build)
+
+    def draw_labels(self, im_, rotate_label):
         def generate_line_start_x_func(bandwidth, bandspacing, offsetx):
             return lambda i: i * (bandwidth + bandspacing) + bandspacing + offsetx
-        #----------------------------------------
-        # Setup the dataset
-        #----------------------------------------
-        sorted_data_ = self.molecular_weight_reorder()
-        max_row_index, min_row_index = self.determine_mw_range_index(sorted_data_)
-
-        sorted_data = sorted_data_.iloc[max_row_index:min_row_index]
-        sorted_data.reset_index(drop = True, inplace = True)
-        
-        #----------------------------------------
-        # Calc the image size and set up the canvas
-        #----------------------------------------
-        if self.image_size == None or self.field_rectangle == None:
-            self.image_size, self.field_rectangle = self.calc_image_size(sorted_data)
-
-        im_ = Image.new('L', self.image_size, color = 255)
-        draw_ = ImageDraw.Draw(im_)
         (field_origin_x, field_origin_y) = self.field_rectangle[0]
-
-        band_spacing = self.band_spacing
         band_width = self.band_width
-        calc_line_start_x = generate_line_start_x_func(band_width, band_spacing, field_origin_x)
-        
-        #----------------------------------------
-        # Set up the signal max
-        #----------------------------------------
-        if signal_max == None:
-            signal_max = self.search_max_signal(sorted_data)
-        else:
-            pass
+        calc_line_start_x = generate_line_start_x_func(band_width, self.band_spacing, field_origin_x)
 
-        #----------------------------------------
-        # Draw Labels
-        #----------------------------------------
         lane_num_offset_y = 8
         baseline_y = field_origin_y - lane_num_offset_y
-        if write_label == True:
-            lane_font_size = self.label_font_size
-            lane_font = ImageFont.load_default(lane_font_size)    # For now, use default font.
-            ascent, descent = lane_font.getmetrics()
-            for i_lane in range(len(self.plot_indices)):
-                label_text = "{}".format(self.plot_labels[i_lane] if self.plot_labels[i_lane] != None else "")
-                left, top, right, bottom = lane_font.getbbox(label_text)
+        lane_font_size = self.label_font_size
+        ascent, descent = glyph_cache.get_metrics(lane_font_size)
+        for i_lane in range(len(self.plot_indices)):
+            label_text = "{}".format(self.plot_labels[i_lane] if self.plot_labels[i_lane] != None else "")
+            left, top, right, bottom = glyph_cache.get_bbox(lane_font_size, label_text)
+            text_width = right - left
+            text_height = bottom - top
+
+            line_start_x = calc_line_start_x(i_lane)
+            line_end_x = line_start_x + band_width
+            text_start_x = (line_start_x + line_end_x) / 2 - text_width / 2
+
+            if rotate_label == False:
+                text_start_y = baseline_y - ascent
+                glyph_cache.draw_text(im_, (text_start_x, text_start_y), label_text, 0, lane_font_size)
+            else:
+                text_bbox_margin = 10 
+                baseline_y = field_origin_y - lane_num_offset_y // 2
+                w_, h_ = text_width + text_bbox_margin, ascent + descent + text_bbox_margin
+                text_image = glyph_cache.get_rotated_label(lane_font_size, label_text, text_bbox_margin)
+                text_start_y = baseline_y - w_
+                text_start_x = line_start_x + (band_width  - h_ )// 2
+                im_.paste(text_image, (text_start_x, text_start_y), text_image)
+
+    def draw_markers(self, mask, sorted_rows, draw_marker_line, write_text):
+        # Draw the marker lines and texts into the mask (255: black in the image).
+        draw_ = ImageDraw.Draw(mask)
+        (field_origin_x, field_origin_y) = self.field_rectangle[0]
+        row_start, row_end = sorted_rows
+        data_length = row_end - row_start
+        field_height = self.calc_field_height(data_length)
+
+        text_right_offset = 1
+        marker_line_length = 5 
+        marker_start_x = field_origin_x - marker_line_length
+        marker_end_x = field_origin_x
+        mw_series = self.sorted_mw[row_start:row_end]
+        # Filter
+        marker_weights_in_range = []
+        if 0 < len(mw_series):
+            marker_weights_in_range = [x for x in self.marker_molecular_weights if mw_series[len(mw_series)-1] <= x[0] and x[0] <= mw_series[0] ]
+        
+        # Load font
+        if write_text == True:
+            font_size = self.marker_font_size
+            mw_font_ascent, mw_font_descent = glyph_cache.get_metrics(font_size)
+            mw_font_vcenter_offset = (mw_font_ascent + mw_font_descent) / 2
+
+        for marker_mw in marker_weights_in_range:
+            row_index = self.search_nearest_mw(marker_mw[0], row_start, row_end) - row_start
+            line_y = self.calc_field_row(row_index, data_length, field_height) + field_origin_y
+
+            if draw_marker_line == True:
+                draw_.line(((marker_start_x, line_y), (marker_end_x, line_y)), 255, width = 3)
+            
+            if write_text == True:
+                text = "{}".format(marker_mw[1] if marker_mw[1] != None else marker_mw[0])
+                
+                # Texts are aligned at Right edge.
+                left, top, right, bottom = glyph_cache.get_bbox(font_size, text)
                 text_width = right - left
-                text_height = bottom - top
-
-                line_start_x = calc_line_start_x(i_lane)
-                line_end_x = line_start_x + band_width
-                text_start_x = (line_start_x + line_end_x) / 2 - text_width / 2
-
-                if rotate_label == False:
-                    text_start_y = baseline_y - ascent
-                    draw_.text((text_start_x, text_start_y), label_text, 0, font = lane_font)
-                else:
-                    text_bbox_margin = 10 
-                    baseline_y = field_origin_y - lane_num_offset_y // 2
-                    w_, h_ = text_width + text_bbox_margin, ascent + descent + text_bbox_margin
-                    #text_image = Image.new('L', (w_, h_), color = 255)
-                    text_image = Image.new('RGBA', (w_, h_), (0,0,0,0))
-                    text_draw = ImageDraw.Draw(text_image)
-                    text_draw.text((text_bbox_margin//2, ascent - text_height), label_text, font = lane_font, fill = (0,0,0,255))
-                    text_image = text_image.rotate(90, expand = True)
-                    text_start_y = baseline_y - w_
-                    text_start_x = line_start_x + (band_width  - h_ )// 2
-                    im_.paste(text_image, (text_start_x, text_start_y), text_image)
+                text_y = line_y - mw_font_vcenter_offset
+                glyph_cache.draw_text(mask, (marker_start_x - text_right_offset - text_width, int(text_y)), text, 255, font_size)
 
 
+    def draw_bands(self, signal_max = None, draw_rectangle = True, draw_marker_line = False, write_text = False, write_label = False, rotate_label = False):
         #----------------------------------------
-        # Draw Bands
+        # Setup the dataset
         #----------------------------------------
-        for row_index, record in sorted_data.iterrows():
-            for i_lane, i_plot in enumerate(self.plot_indices):
-                signal_raw = record.iloc[i_plot]
-
-                line_start_x = calc_line_start_x(i_lane)
-                line_end_x   = line_start_x + band_width
-                line_y = row_index + field_origin_y
-                gray_scale_signal = self.calc_normalized_signal(signal_raw, signal_max)
-                draw_.line( ((line_start_x, line_y), (line_end_x, line_y)), fill = gray_scale_signal )
-
-                if row_index == 0:
-                    pass
-
-        if draw_rectangle == True:
-            draw_.rectangle(self.field_rectangle, outline = 0, width = 2)
+        if isinstance(self.data, pd.DataFrame) == False or self.data.empty == True:
+            raise
+        sorted_rows = self.determine_mw_range_index()
         
         #----------------------------------------
-        # Draw Marker and Marker-Label
+        # Calc the image size
         #----------------------------------------
-        if draw_marker_line == True or write_text == True:
-            text_right_offset = 1
-            marker_line_length = 5 
-            marker_start_x = field_origin_x - marker_line_length
-            marker_end_x = field_origin_x
-            mw_series = sorted_data.iloc[:, self.mw_column_index]
-            # Filter
-            marker_weights_in_range = []
-            if 0 < len(mw_series):
-                marker_weights_in_range = [x for x in self.marker_molecular_weights if mw_series[len(mw_series)-1] <= x[0] and x[0] <= mw_series[0] ]
-            
-            # Load font
-            if write_text == True:
-                font_size = self.marker_font_size
-                font = ImageFont.load_default(font_size)    # For now, use default font.
-                mw_font_ascent, mw_font_descent = font.getmetrics()
-                mw_font_vcenter_offset = (mw_font_ascent + mw_font_descent) / 2
+        self.image_size, self.field_rectangle = self.calc_image_size(sorted_rows[1] - sorted_rows[0])
 
-            for marker_mw in marker_weights_in_range:
-                row_index = (mw_series - marker_mw[0]).abs().argmin()
-                line_y = row_index + field_origin_y
+        #----------------------------------------
+        # Composite the layers
+        #----------------------------------------
+        gray_scale_matrix, self.resampled = self.get_band_layer(sorted_rows, signal_max)
 
-                if draw_marker_line == True:
-                    draw_.line(((marker_start_x, line_y), (marker_end_x, line_y)), 0, width = 3)
-                
-                if write_text == True:
-                    text = "{}".format(marker_mw[1] if marker_mw[1] != None else marker_mw[0])
-                    
-                    # Texts are aligned at Right edge.
-                    left, top, right, bottom = font.getbbox(text)
-                    text_width = right - left
-                    text_start_x = marker_start_x - text_right_offset - text_width
-                    text_height = bottom - top
-                    text_y = line_y - mw_font_vcenter_offset
-                    draw_.text((marker_start_x - text_right_offset - text_width, int(text_y)), text, 0, font = font)
+        canvas = np.array(self.get_label_layer(write_label, rotate_label), dtype = np.uint8)
+        self.rasterize_bands(canvas, gray_scale_matrix, self.field_rectangle[0])
+        im_ = Image.fromarray(canvas)
+
+        if draw_rectangle == True:
+            ImageDraw.Draw(im_).rectangle(self.field_rectangle, outline = 0, width = 2)
+
+        marker_layer = self.get_marker_layer(sorted_rows, draw_marker_line, write_text)
+        if marker_layer != None:
+            marker_mask, marker_bbox = marker_layer
+            im_.paste(0, marker_bbox, marker_mask)
 
         self.image = im_
         return True
@@ -296,11 +435,12 @@ class WesternBlotPlotUtil:
 
 
 if __name__ == '__main__':
-    filename = "example/20240424_Abby txt data.xlsx"
-    raw_data = pd.read_excel(filename)
-
-    plot_obj = WesternBlotPlotUtil(raw_data, plot_sample_indices = [1,2,3,4,5,6,7,8], mw_column_index = 0, offset = 30, marker_molecular_weights = [230, 180, 116, 66, 40, 12])
-    plot_obj.set_molecular_weight_range(100, 300)
-    plot_obj.draw_bands(signal_max = 10000)
-    plot_obj.save_png('hogehoge.png')
+    import data_loader
+    filename = "example/example.txt"
+    raw_data = data_loader.read_data(filename, filename)
+
+    plot_obj = WesternBlotPlotUtil(raw_data, plot_sample_indices = [1,2,3,4,5,6,7,8], mw_column_index = 0, offset = 30, marker_molecular_weights = [(230, None), (180, None), (116, None), (66, None), (40, None), (12, None)])
+    plot_obj.set_molecular_weight_range(10, 300)
+    plot_obj.draw_bands(signal_max = 10000, draw_marker_line = True, write_text = True)
+    plot_obj.save_png('image.png')
     #plot_obj.get_image_obj()
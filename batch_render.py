@@ -0,0 +1,306 @@
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import config
+import data_loader
+import normalization
+import render
+import composite
+import utilfuncs
+
+mw_column_name = 'kDa'
+
+############################################################
+#  Settings file
+############################################################
+# Example (all keys are optional):
+# {
+#     "draw_type": "as_is",                   # or "normalized_new"
+#     "lanes": ["P1:1", "P1:2", "P1:3"],      # lane order (default: all series)
+#     "custom_labels": ["WT", "KO", null],
+#     "lane_label": "lane_number",            # null, "lane_number", "sample_name" or "user_defined"
+#     "rotate_label": false,
+#     "signal_limit": 10000,                  # null or 0: the max signal in the lanes
+#     "mw_range": [20, 230],
+#     "marker_line": true,
+#     "marker_label": true,
+#     "markers": "230, 180, 116[beta-gal], 66[BSA], 40, 12",
+#     "band_width": 20, "band_spacing": 10,
+#     "offset_top": 40, "offset_bottom": 40, "offset_left": 40, "offset_right": 40,
+#     "lane_label_size": 16, "mw_label_size": 16,
+#     "field_height": 1000,                   # null: one pixel per data point. Taller data are resampled.
+#     "pooling": "max",                       # resampling: "max" or "mean"
+#     "normalization": {
+#         "reference": "P1:1",                # total protein series to normalize to
+#         "total": ["P1:1", "P1:2"],          # total protein series
+#         "associated": {"P2:1": "P1:1"},     # target series -> total protein series
+#         "signal_range": [20, 230],
+#         "stop_at_negative": false
+#     },
+#     "panels": [                             # lane groups of the composite image (--composite)
+#         {"title": "Plate 1", "lanes": ["P1:1", "P1:2"], "custom_labels": ["WT", "KO"]},
+#         {"title": "Plate 2", "lanes": ["P2:1", "P2:2"]}
+#     ]
+# }
+def load_settings(filename):
+    if filename == None:
+        return {}
+    with open(filename, encoding = 'utf-8') as f:
+        return json.load(f)
+
+def make_lane_relationship(series_names, normalization_settings):
+    total_series = normalization_settings.get("total", [normalization_settings["reference"]])
+    associated = normalization_settings.get("associated", {})
+    lane_relationship = []
+    for sample_name in series_names:
+        if sample_name in total_series:
+            lane_relationship.append({"sample_name": sample_name, "type": "Total", "associated_lane": None})
+        else:
+            lane_relationship.append({"sample_name": sample_name, "type": "Target", "associated_lane": associated.get(sample_name)})
+    return lane_relationship
+
+def make_render_settings(column_names, settings):
+    series_names = [x for x in column_names if x != mw_column_name]
+    lanes = settings.get("lanes", series_names)
+    custom_labels = settings.get("custom_labels", [])
+    lane_records = [{"sample_name": x, "label": custom_labels[i] if i < len(custom_labels) else None} for i, x in enumerate(lanes)]
+
+    plot_labels = []
+    lane_label = settings.get("lane_label")
+    if lane_label == "lane_number":
+        plot_labels = ["{}".format(i+1) for i in range(len(lanes))]
+    elif lane_label == "user_defined":
+        plot_labels = [x["label"] for x in lane_records]
+    elif lane_label == "sample_name":
+        plot_labels = list(lanes)
+
+    draw_marker_line = settings.get("marker_line", False)
+    write_text = settings.get("marker_label", False)
+    marker_mw_list = []
+    markers = settings.get("markers")
+    if (draw_marker_line == True or write_text == True) and markers:
+        marker_mw_list = utilfuncs.parse_labeled_numbers(markers)
+
+    signal_limit = settings.get("signal_limit")
+    render_settings = {
+        "plot_indices": [column_names.index(x) for x in lanes],
+        "plot_labels": plot_labels,
+        "write_label": lane_label != None,
+        "rotate_label": settings.get("rotate_label", False),
+        "signal_limit": signal_limit if signal_limit != 0 else None,
+        "mw_range": settings.get("mw_range"),
+        "draw_marker_line": draw_marker_line,
+        "write_text": write_text,
+        "marker_molecular_weights": marker_mw_list,
+    }
+    for key, value in render.default_values.items():
+        render_settings[key] = settings.get(key, value)
+    render_settings["field_height"] = settings.get("field_height")
+    render_settings["pooling"] = settings.get("pooling", "max")
+    return render_settings, lane_records
+
+
+############################################################
+#  Process one file (runs in a worker process)
+############################################################
+def save_pyramid(df, render_settings, directory, tile_height):
+    # directory/<level>/<tile index>.png
+    levels = render.render_pyramid(df, dict(render_settings, field_height = None), tile_height)
+    for level, tiles in enumerate(levels):
+        os.makedirs(os.path.join(directory, str(level)), exist_ok = True)
+        for i, tile in enumerate(tiles):
+            tile.save(os.path.join(directory, str(level), "{}.png".format(i)))
+
+def load_dataset(filename, settings, timings, load_stats = None):
+    # Returns (data to draw, names of the series with blank cells, normalized data or None, normalization log)
+    time_start = time.perf_counter()
+    df = data_loader.read_data(filename, filename, stats = load_stats)
+    if df is None:
+        raise ValueError("Invalid Data.")
+    if df.columns[0] != mw_column_name:
+        raise ValueError("The first column must be 'kDa'.")
+    df, blank_contain_series = data_loader.fill_blank_cells(df)
+    timings["load"] = time.perf_counter() - time_start
+
+    #----------------------------------------
+    # Normalization
+    #----------------------------------------
+    result_df = None
+    normalization_log = ""
+    draw_type = settings.get("draw_type", "as_is")
+    normalization_settings = settings.get("normalization")
+    if normalization_settings != None:
+        time_normalization = time.perf_counter()
+        lane_relationship = make_lane_relationship(list(df.columns)[1:], normalization_settings)
+        result_df, summary = normalization.normalize(
+            df, lane_relationship, normalization_settings["reference"],
+            signal_range = normalization_settings.get("signal_range"),
+            stop_summation_negative = normalization_settings.get("stop_at_negative", False))
+        normalization_log = "\nNormalization (Reference: {})\n".format(normalization_settings["reference"])
+        for record in summary:
+            normalization_log += "{}\t{}\t{}\t{}\t{}\n".format(
+                record["sample_name"], record["raw_total_signal"], record["factor"],
+                record["stop_mw"] if record["stop_mw"] != None else "", record["note"])
+        if draw_type == "normalized_new":
+            df = result_df
+        timings["normalize"] = time.perf_counter() - time_normalization
+    elif draw_type == "normalized_new":
+        raise ValueError("'normalization' is required to draw the normalized data.")
+    return df, blank_contain_series, result_df, normalization_log
+
+def process_file(filename, settings, output_dir, pyramid_tile_height = None):
+    timings = {}
+    time_start = time.perf_counter()
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    try:
+        load_stats = {}
+        df, blank_contain_series, result_df, normalization_log = load_dataset(filename, settings, timings, load_stats)
+        if result_df is not None:
+            result_df.to_csv(os.path.join(output_dir, "normalized_{}.txt".format(stem)), sep = '\t', index = False)
+        draw_type = settings.get("draw_type", "as_is")
+        column_names = list(df.columns)
+
+        #----------------------------------------
+        # Render
+        #----------------------------------------
+        time_render = time.perf_counter()
+        render_settings, lane_records = make_render_settings(column_names, settings)
+        render_stats = {}
+        img = render.render_image(df, render_settings, stats = render_stats)
+        timings["render"] = time.perf_counter() - time_render
+
+        time_encode = time.perf_counter()
+        image_bytes = render.encode_image(img, render.make_encoding(config.download_format))
+        with open(os.path.join(output_dir, "image_{}{}".format(stem, render.image_formats[config.download_format]["extension"])), 'wb') as f:
+            f.write(image_bytes)
+        timings["encode"] = time.perf_counter() - time_encode
+
+        if pyramid_tile_height != None:
+            time_pyramid = time.perf_counter()
+            save_pyramid(df, render_settings, os.path.join(output_dir, "pyramid_{}".format(stem)), pyramid_tile_height)
+            timings["pyramid"] = time.perf_counter() - time_pyramid
+
+        log_details = render.describe_render_settings(render_settings) + render.describe_render_stats(render_stats)
+        if 0 < len(blank_contain_series):
+            log_details += "Note: The series {} contains blank cells.\n".format(", ".join(sorted(blank_contain_series)))
+        log_text = render.make_log_text(os.path.basename(filename), draw_type, lane_records, log_details + normalization_log)
+        with open(os.path.join(output_dir, "log_{}.txt".format(stem)), 'w', encoding = 'utf-8') as f:
+            f.write(log_text)
+    except Exception as e:
+        timings["total"] = time.perf_counter() - time_start
+        return filename, False, "{}: {}".format(type(e).__name__, e), timings
+
+    timings["total"] = time.perf_counter() - time_start
+    return filename, True, "peak parse memory {:.1f} MB".format(load_stats["peak_memory"] / 1024 / 1024), timings
+
+
+############################################################
+#  Composite of all files (--composite)
+############################################################
+def render_composite_files(files, settings, output_dir, columns = None, max_workers = None):
+    # One panel per file, or per lane group in settings["panels"] of each file.
+    # Writes composite.png and log_composite.txt. Returns the number of files which failed.
+    panels = []
+    log_details = ""
+    n_failed = 0
+    for filename in files:
+        stem = os.path.splitext(os.path.basename(filename))[0]
+        try:
+            df, blank_contain_series, _, normalization_log = load_dataset(filename, settings, {})
+        except Exception as e:
+            n_failed += 1
+            print("{}: FAILED ({}: {})".format(filename, type(e).__name__, e))
+            continue
+        column_names = list(df.columns)
+        for group in settings.get("panels", [{}]):
+            group_settings = dict(settings, **{x: group[x] for x in ("lanes", "custom_labels") if x in group})
+            render_settings, lane_records = make_render_settings(column_names, group_settings)
+            title = stem if "title" not in group else (group["title"] if len(files) == 1 else "{}: {}".format(stem, group["title"]))
+            panels.append({"title": title, "dataframe": df, "render_settings": render_settings})
+            log_details += render.make_log_text(os.path.basename(filename), settings.get("draw_type", "as_is"), lane_records,
+                                                "Panel: {}\n".format(title) + normalization_log) + "\n"
+        if 0 < len(blank_contain_series):
+            log_details += "Note: The series {} in {} contains blank cells.\n\n".format(", ".join(sorted(blank_contain_series)), filename)
+    if len(panels) == 0:
+        return n_failed
+
+    time_render = time.perf_counter()
+    img, layout = composite.render_composite(panels, columns, max_workers)
+    time_render = time.perf_counter() - time_render
+    img.save(os.path.join(output_dir, "composite.png"))
+
+    log_details = render.describe_render_settings(panels[0]["render_settings"]) + "\n" + log_details
+    for x in layout:
+        log_details += "{}\t{}\n".format(x["title"], x["box"])
+    with open(os.path.join(output_dir, "log_composite.txt"), 'w', encoding = 'utf-8') as f:
+        f.write(log_details)
+    print("Composite of {} panels ({} x {} px) rendered in {:.3f} s".format(len(panels), img.width, img.height, time_render))
+    return n_failed
+
+
+############################################################
+#  Main
+############################################################
+def collect_input_files(inputs):
+    files = []
+    for input_path in inputs:
+        if os.path.isdir(input_path):
+            candidates = [os.path.join(input_path, x) for x in os.listdir(input_path)]
+        else:
+            candidates = glob.glob(input_path)
+        files.extend(x for x in candidates if os.path.isfile(x) and x.endswith(data_loader.data_file_extensions))
+    # Remove duplicates, keeping the order
+    return list(dict.fromkeys(sorted(files)))
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Render virtual lane images of Simple Western data files in batch.")
+    parser.add_argument("inputs", nargs = '+', help = "Data files, directories or glob patterns (e.g. 'data/*.txt').")
+    parser.add_argument("-s", "--settings", help = "Settings file (JSON).")
+    parser.add_argument("-o", "--output-dir", default = "output", help = "Output directory (default: output).")
+    parser.add_argument("-j", "--jobs", type = int, default = None, help = "Number of worker processes (default: number of CPUs).")
+    parser.add_argument("--pyramid", type = int, default = None, metavar = "TILE_HEIGHT",
+                        help = "Also write a tiled pyramid of the full resolution image (pyramid_<name>/<level>/<tile>.png).")
+    parser.add_argument("--composite", action = "store_true",
+                        help = "Render all files (and the lane groups in 'panels' of the settings) into one grid image, composite.png.")
+    parser.add_argument("--columns", type = int, default = None,
+                        help = "Number of panels in a row of the composite image (default: all in one row).")
+    args = parser.parse_args(argv)
+
+    settings = load_settings(args.settings)
+    files = collect_input_files(args.inputs)
+    if len(files) == 0:
+        print("No input files found.", file = sys.stderr)
+        return 1
+    os.makedirs(args.output_dir, exist_ok = True)
+
+    time_start = time.perf_counter()
+    if args.composite:
+        n_failed = render_composite_files(files, settings, args.output_dir, args.columns, args.jobs)
+        print("Processed {} files ({} failed) in {:.2f} s.".format(len(files), n_failed, time.perf_counter() - time_start))
+        return 0 if n_failed == 0 else 1
+
+    n_failed = 0
+    with ProcessPoolExecutor(max_workers = args.jobs) as executor:
+        futures = [executor.submit(process_file, x, settings, args.output_dir, args.pyramid) for x in files]
+        for i, future in enumerate(as_completed(futures)):
+            filename, success, message, timings = future.result()
+            timing_text = ", ".join("{} {:.3f} s".format(key, value) for key, value in timings.items())
+            if success:
+                print("[{}/{}] {}: {} ({})".format(i+1, len(files), filename, timing_text, message))
+            else:
+                n_failed += 1
+                print("[{}/{}] {}: FAILED ({}) {}".format(i+1, len(files), filename, message, timing_text))
+    time_elapsed = time.perf_counter() - time_start
+
+    print("")
+    print("Processed {} files ({} succeeded, {} failed) in {:.2f} s ({:.3f} s/file).".format(
+        len(files), len(files) - n_failed, n_failed, time_elapsed, time_elapsed / len(files)))
+    return 0 if n_failed == 0 else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
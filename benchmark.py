@@ -0,0 +1,303 @@
+import os
+import sys
+import json
+import time
+import base64
+import platform
+import argparse
+import subprocess
+import numpy as np
+import pandas as pd
+import PIL
+
+import data_loader
+import utilfuncs
+import normalization
+import band_plot_utils
+import signal_graph
+import callback
+
+mw_column_name = 'kDa'
+template_filename = os.path.join(os.path.dirname(os.path.abspath(__file__)), "example", "example.txt")
+
+############################################################
+#  Synthetic Simple Western datasets
+############################################################
+# The kDa axis and the signal profiles are taken from example/example.txt and stretched to n_rows.
+# Each series is a template series (in turn) with a random gain and noise. Blank cells of the template
+# are kept as blank cells.
+def make_dataset(n_rows, n_series, seed = 0):
+    template = data_loader.read_data(template_filename, template_filename)
+    rng = np.random.default_rng(seed)
+    template_rows = np.arange(len(template))
+    rows = np.linspace(0, len(template) - 1, n_rows)
+
+    columns = {mw_column_name: np.interp(rows, template_rows, template[mw_column_name].to_numpy())}
+    template_series = [x for x in template.columns if x != mw_column_name]
+    for i in range(n_series):
+        name = template_series[i % len(template_series)]
+        source = template[name].to_numpy(dtype = np.float64)
+        blank = np.isnan(source)
+        signal = np.interp(rows, template_rows[~blank], source[~blank]) if (~blank).any() else np.full(n_rows, np.nan)
+        signal = signal * rng.uniform(0.5, 2.0) + rng.normal(0, 0.05 * np.nanstd(source) if (~blank).any() else 0, n_rows)
+        if blank.any():
+            signal[np.interp(rows, template_rows, blank.astype(float)) >= 0.5] = np.nan
+        columns["{}:{}".format(name.split(':')[0], i + 1)] = signal
+    return pd.DataFrame(columns)
+
+def make_context(n_rows, n_series, seed = 0):
+    df = make_dataset(n_rows, n_series, seed)
+    series_names = [x for x in df.columns if x != mw_column_name]
+    text = df.to_csv(sep = '\t', index = False, na_rep = '')
+    return {
+        "name": "{}x{}".format(n_rows, n_series),
+        "df": df,
+        "filled_df": data_loader.fill_blank_cells(df)[0],
+        "contents": "data:text/plain;base64," + base64.b64encode(text.encode('utf-8')).decode('ascii'),
+        "lane_relationship": [{"sample_name": x, "type": "Total" if i == 0 else "Target", "associated_lane": series_names[0] if i != 0 else None}
+                              for i, x in enumerate(series_names)],
+        "reference": series_names[0],
+        # Built once per dataset, as dataset_store.get_signal_sum_index() does
+        "signal_sum_index": normalization.SignalSumIndex(df),
+    }
+
+############################################################
+#  Benchmarks
+############################################################
+def bench_draw_bands(context):
+    df = context["filled_df"]
+    plot_obj = band_plot_utils.WesternBlotPlotUtil(df, list(range(1, len(df.columns))), offset = 40,
+                                                   plot_labels = ["{}".format(i + 1) for i in range(len(df.columns) - 1)],
+                                                   marker_molecular_weights = [(230, None), (116, None), (66, "BSA"), (40, None), (12, None)])
+    plot_obj.draw_bands(draw_marker_line = True, write_text = True, write_label = True)
+
+def bench_calc_signal_sum(context):
+    utilfuncs.calc_signal_sum(context["df"])
+
+def bench_calc_signal_sum2(context):
+    utilfuncs.calc_signal_sum2(context["df"])
+
+def bench_calc_signal_sum_positive_region(context):
+    utilfuncs.calc_signal_sum_positive_region(context["df"])
+
+def bench_signal_sum_index(context):
+    # Live Normalization Summary: kDa window and signal sums (stopping at the first negative value) from the index
+    signal_sum_index = context["signal_sum_index"]
+    signal_sum_index.find_window((20, 230))
+    signal_sum_index.calc_signal_sums((20, 230), stop_summation_negative = True)
+
+def bench_parse_contents(context):
+    callback.parse_contents(context["contents"], "data.txt")
+
+def bench_normalize(context):
+    normalization.normalize(context["filled_df"], context["lane_relationship"], context["reference"], signal_range = (20, 230))
+
+def bench_build_figure(context):
+    # Built from scratch: the memoized traces are cleared.
+    signal_graph.trace_cache.clear()
+    signal_graph.series_key_cache.clear()
+    signal_graph.build_figure(context["name"], context["df"])
+
+benchmarks = {
+    "draw_bands": bench_draw_bands,
+    "calc_signal_sum": bench_calc_signal_sum,
+    "calc_signal_sum2": bench_calc_signal_sum2,
+    "calc_signal_sum_positive_region": bench_calc_signal_sum_positive_region,
+    "signal_sum_index": bench_signal_sum_index,
+    "parse_contents": bench_parse_contents,
+    "normalize": bench_normalize,
+    "build_figure": bench_build_figure,
+}
+
+def run_benchmark(func, context, repeat):
+    # Returns {"time": best wall time, "median_time", "peak_memory"}.
+    # The times are measured without tracemalloc, the peak memory in one more run with it.
+    times = []
+    for _ in range(repeat):
+        time_start = time.perf_counter()
+        func(context)
+        times.append(time.perf_counter() - time_start)
+    stats = {}
+    with utilfuncs.measure(stats, "time"):
+        func(context)
+    return {"time": min(times), "median_time": float(np.median(times)), "peak_memory": stats["peak_memory"]}
+
+############################################################
+#  Import time (cold start of a worker)
+############################################################
+# Each import runs in a new interpreter. "import app" is what a worker does before it serves; with the warmup
+# it also loads the libraries which the callbacks import on first use (what "import app" used to load).
+import_benchmarks = {
+    "import app": "import app",
+    "import app + warmup": "import app\nimport warmup\nwarmup.warmup()",
+}
+heavy_modules = ("numpy", "pandas", "openpyxl", "PIL.ImageFont", "plotly.graph_objs._figure")
+
+import_script = """
+import sys, time, json, resource
+time_start = time.perf_counter()
+{}
+elapsed = time.perf_counter() - time_start
+max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+print(json.dumps({{"time": elapsed, "max_rss": max_rss, "modules": [x for x in {} if x in sys.modules]}}))
+"""
+
+def run_import_benchmark(code, repeat):
+    # Returns {"time": best wall time, "median_time", "peak_memory" (max RSS), "modules": heavy modules loaded}
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-c", import_script.format(code, heavy_modules)], capture_output = True, text = True, check = True,
+                                cwd = os.path.dirname(os.path.abspath(__file__))).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    times = [x["time"] for x in runs]
+    return {"time": min(times), "median_time": float(np.median(times)), "peak_memory": max(x["max_rss"] for x in runs), "modules": runs[0]["modules"]}
+
+############################################################
+#  Pixel parity of the band raster
+############################################################
+# draw_bands() rasterizes the bands with NumPy. reference_draw_bands() is the previous implementation
+# (pandas sort, iterrows and one ImageDraw.line per data point and lane), kept here to check that both draw
+# the same pixels on example/example.txt.
+def reference_draw_bands(data, plot_indices, band_width, band_spacing, offset, mw_range, signal_max):
+    from PIL import Image, ImageDraw
+    mw_key = data.columns[0]
+    sorted_data = data.sort_values(by = mw_key, ascending = False).reset_index(drop = True)
+    mw_series_full = sorted_data.iloc[:, 0]
+    min_row_index = len(mw_series_full)
+    if mw_range[0] != None and mw_series_full[len(mw_series_full) - 1] < mw_range[0]:
+        min_row_index = min(len(mw_series_full), (mw_series_full - mw_range[0]).abs().idxmin())
+    max_row_index = 0
+    if mw_range[1] != None and mw_range[1] < mw_series_full[0]:
+        max_row_index = (mw_series_full - mw_range[1]).abs().idxmin()
+    sorted_data = sorted_data.iloc[max_row_index:min_row_index].reset_index(drop = True)
+
+    field_width = (band_width + band_spacing) * len(plot_indices) + band_spacing
+    field_rectangle = ((offset, offset), (offset + field_width, offset + len(sorted_data)))
+    im_ = Image.new('L', (field_width + 2 * offset, len(sorted_data) + 2 * offset), color = 255)
+    draw_ = ImageDraw.Draw(im_)
+    if signal_max == None:
+        signal_max = max([0] + [sorted_data.iloc[:, i].max() for i in plot_indices])
+    for row_index, record in sorted_data.iterrows():
+        for i_lane, i_plot in enumerate(plot_indices):
+            signal_in_range = min(record.iloc[i_plot], signal_max)
+            line_start_x = i_lane * (band_width + band_spacing) + band_spacing + offset
+            draw_.line(((line_start_x, row_index + offset), (line_start_x + band_width, row_index + offset)),
+                       fill = int(255 * (1 - signal_in_range / signal_max)))
+    draw_.rectangle(field_rectangle, outline = 0, width = 2)
+    return im_
+
+def check_parity():
+    # Returns the list of the settings whose images differ.
+    data = data_loader.fill_blank_cells(data_loader.read_data(template_filename, template_filename))[0]
+    n_series = len(data.columns) - 1
+    mismatches = []
+    n_checked = 0
+    for plot_indices in (list(range(1, n_series + 1)), [3, 1, 3], [n_series]):
+        for signal_max in (None, 1000, 20000):
+            for band_width, band_spacing in ((20, 10), (1, 0), (7, 3)):
+                for offset in (0, 40):
+                    for mw_range in ((None, None), (12, 230), (40, 116), (300, None)):
+                        plot_obj = band_plot_utils.WesternBlotPlotUtil(data, plot_indices, band_width = band_width, band_spacing = band_spacing, offset = offset)
+                        plot_obj.set_molecular_weight_range(*mw_range)
+                        plot_obj.draw_bands(signal_max = signal_max)
+                        reference = reference_draw_bands(data, plot_indices, band_width, band_spacing, offset, mw_range, signal_max)
+                        n_checked += 1
+                        if np.array_equal(np.asarray(plot_obj.get_image_obj()), np.asarray(reference)) == False:
+                            mismatches.append({"plot_indices": plot_indices, "signal_max": signal_max, "band_width": band_width,
+                                               "band_spacing": band_spacing, "offset": offset, "mw_range": mw_range})
+    print("Band raster parity: {} of {} images identical to the reference".format(n_checked - len(mismatches), n_checked))
+    return mismatches
+
+def compare(results, baseline, threshold, min_time):
+    # Returns the list of regressions: (name, key, baseline value, current value)
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        for key in ("time", "peak_memory"):
+            base_value = baseline[name][key]
+            if key == "time" and result[key] < min_time:
+                continue
+            if base_value * (1 + threshold) < result[key]:
+                regressions.append((name, key, base_value, result[key]))
+    return regressions
+
+############################################################
+#  Main
+############################################################
+def parse_sizes(sizes_str):
+    # "546x14,5000x96" -> [(546, 14), (5000, 96)]
+    return [tuple(int(y) for y in x.strip().split('x')) for x in sizes_str.split(',') if x.strip() != ""]
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Benchmark the rendering, parsing, normalization and line plots on synthetic datasets.")
+    parser.add_argument("--sizes", default = "546x14,5000x96,50000x24",
+                        help = "Dataset sizes as ROWSxSERIES, comma separated (default: 546x14,5000x96,50000x24).")
+    parser.add_argument("--repeat", type = int, default = 5, help = "Number of timed runs of each benchmark (default: 5).")
+    parser.add_argument("--seed", type = int, default = 0, help = "Random seed of the synthetic data (default: 0).")
+    parser.add_argument("--imports", action = "store_true", help = "Also measure the import time of the app (in new interpreters).")
+    parser.add_argument("--filter", default = None, help = "Run only the benchmarks whose name contains this text.")
+    parser.add_argument("-o", "--output", default = None, help = "Write the results to this JSON file (e.g. a new baseline).")
+    parser.add_argument("-b", "--baseline", default = None, help = "Compare with this JSON file and fail on regressions.")
+    parser.add_argument("--threshold", type = float, default = 0.25,
+                        help = "Allowed increase of the time and the peak memory over the baseline (default: 0.25 = 25%%).")
+    parser.add_argument("--min-time", type = float, default = 0.002,
+                        help = "Times shorter than this (s) are not compared (default: 0.002).")
+    parser.add_argument("--parity", action = "store_true",
+                        help = "Only check that the band raster is identical to the reference implementation on example/example.txt.")
+    args = parser.parse_args(argv)
+
+    if args.parity:
+        mismatches = check_parity()
+        for x in mismatches:
+            print("MISMATCH {}".format(x))
+        return 1 if 0 < len(mismatches) else 0
+
+    results = {}
+    if args.imports:
+        for name, code in import_benchmarks.items():
+            if args.filter != None and args.filter not in name:
+                continue
+            results[name] = run_import_benchmark(code, args.repeat)
+            print("{:44s} {:9.4f} s (median {:9.4f} s) {:9.1f} MB max RSS, loaded: {}".format(
+                name, results[name]["time"], results[name]["median_time"], results[name]["peak_memory"] / 1024 / 1024,
+                ", ".join(results[name]["modules"]) or "-"))
+        if "import app" in results and "import app + warmup" in results:
+            print("Deferred to the first use (or the warmup): {:.3f} s".format(
+                results["import app + warmup"]["median_time"] - results["import app"]["median_time"]))
+    for n_rows, n_series in parse_sizes(args.sizes):
+        context = make_context(n_rows, n_series, args.seed)
+        for bench_name, func in benchmarks.items():
+            name = "{} {}".format(bench_name, context["name"])
+            if args.filter != None and args.filter not in name:
+                continue
+            results[name] = run_benchmark(func, context, args.repeat)
+            print("{:44s} {:9.4f} s (median {:9.4f} s) {:9.1f} MB".format(
+                name, results[name]["time"], results[name]["median_time"], results[name]["peak_memory"] / 1024 / 1024))
+
+    if args.output != None:
+        output = {
+            "environment": {
+                "python": platform.python_version(), "platform": platform.platform(),
+                "numpy": np.__version__, "pandas": pd.__version__, "pillow": PIL.__version__,
+            },
+            "settings": {"repeat": args.repeat, "seed": args.seed},
+            "results": results,
+        }
+        with open(args.output, 'w', encoding = 'utf-8') as f:
+            json.dump(output, f, indent = 2)
+
+    if args.baseline != None:
+        with open(args.baseline, encoding = 'utf-8') as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold, args.min_time)
+        print("")
+        for name, key, base_value, value in regressions:
+            print("REGRESSION {} {}: {:.4g} -> {:.4g} ({:+.0%})".format(name, key, base_value, value, value / base_value - 1))
+        if 0 < len(regressions):
+            return 1
+        print("No regressions over {:.0%} compared with {}.".format(args.threshold, args.baseline))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,205 @@
+import os
+import time
+import threading
+import tempfile
+from collections import OrderedDict
+
+############################################################
+#  Private cache directory
+############################################################
+def make_private_dir(directory: str):
+    # Creates the directory readable and writable only by this user (0o700). An existing directory must be owned
+    # by this user: another user could otherwise plant or replace the cached files (e.g. in a shared /tmp).
+    os.makedirs(directory, mode = 0o700, exist_ok = True)
+    if os.path.islink(directory) or not os.path.isdir(directory):
+        raise PermissionError("Cache directory is not a directory: {}".format(directory))
+    stat = os.lstat(directory)
+    if hasattr(os, "getuid"):
+        if stat.st_uid != os.getuid():
+            raise PermissionError("Cache directory is owned by another user: {}".format(directory))
+        if stat.st_mode & 0o077 != 0:
+            os.chmod(directory, 0o700)
+    return directory
+
+
+############################################################
+#  In-process LRU store
+############################################################
+class MemoryStore:
+    # max_age (seconds): items not used for longer are dropped. None: kept until evicted by size.
+    def __init__(self, max_bytes: int, sizeof = len, max_age: float | None = None):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.max_age = max_age
+        self._items = OrderedDict()
+        self._sizes = {}
+        self._times = {}
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _remove(self, key):
+        del self._items[key]
+        del self._times[key]
+        self.total_bytes -= self._sizes.pop(key)
+
+    def _expire(self):
+        # The items are in the order of their last use, so the expired ones are at the front.
+        if self.max_age == None:
+            return
+        deadline = time.monotonic() - self.max_age
+        while 0 < len(self._items):
+            key = next(iter(self._items))
+            if deadline < self._times[key]:
+                break
+            self._remove(key)
+
+    def get(self, key):
+        with self._lock:
+            self._expire()
+            if key not in self._items:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self._times[key] = time.monotonic()
+            self.hits += 1
+            return self._items[key]
+
+    def put(self, key, value, nbytes: int | None = None):
+        if nbytes == None:
+            nbytes = self.sizeof(value)
+        with self._lock:
+            self._expire()
+            if key in self._items:
+                self._remove(key)
+            if self.max_bytes < nbytes:
+                # Never keep an item larger than the whole store.
+                return
+            self._items[key] = value
+            self._sizes[key] = nbytes
+            self._times[key] = time.monotonic()
+            self.total_bytes += nbytes
+            # Evict least recently used items
+            while self.max_bytes < self.total_bytes:
+                self._remove(next(iter(self._items)))
+
+    def __contains__(self, key):
+        with self._lock:
+            self._expire()
+            return key in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._sizes.clear()
+            self._times.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+        return {"items": len(self._items), "bytes": self.total_bytes, "hits": self.hits, "misses": self.misses}
+
+
+############################################################
+#  On-disk store (shared among worker processes)
+############################################################
+class DiskStore:
+    # Each item is a file named by its key. The file mtime is refreshed on read so that
+    # the eviction removes the least recently used files first.
+    # max_age (seconds): files not used for longer are removed (at the next access of the store by any worker).
+    def __init__(self, directory: str, max_bytes: int, max_age: float | None = None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        make_private_dir(self.directory)
+        self.last_evict_time = 0
+        self.evict()
+
+    def _path(self, key: str):
+        return os.path.join(self.directory, key)
+
+    def is_expired(self, mtime: float):
+        return self.max_age != None and mtime < time.time() - self.max_age
+
+    def get(self, key: str) -> bytes | None:
+        if self.max_age != None and min(60, self.max_age) < time.monotonic() - self.last_evict_time:
+            self.evict()
+        path = self._path(key)
+        try:
+            if self.is_expired(os.stat(path).st_mtime):
+                os.remove(path)
+                raise FileNotFoundError(path)
+            with open(path, 'rb') as f:
+                value = f.read()
+            os.utime(path)
+        except OSError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def put(self, key: str, value: bytes):
+        if self.max_bytes < len(value):
+            return
+        # Write to a temporary file and rename it, so that other workers never read a partial file.
+        fd, tmp_path = tempfile.mkstemp(dir = self.directory, prefix = ".tmp_")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(value)
+            os.replace(tmp_path, self._path(key))
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self.evict()
+
+    def __contains__(self, key: str):
+        try:
+            return not self.is_expired(os.stat(self._path(key)).st_mtime)
+        except OSError:
+            return False
+
+    def list_files(self):
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.is_file() and not entry.name.startswith(".tmp_"):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def evict(self):
+        # Removes the expired files, then the least recently used files until the total size fits.
+        self.last_evict_time = time.monotonic()
+        entries = []
+        for mtime, size, path in self.list_files():
+            if self.is_expired(mtime):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            else:
+                entries.append((mtime, size, path))
+        total_bytes = sum(x[1] for x in entries)
+        if total_bytes <= self.max_bytes:
+            return
+        for mtime, size, path in sorted(entries):
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total_bytes -= size
+            if total_bytes <= self.max_bytes:
+                break
+
+    def stats(self):
+        entries = self.list_files()
+        return {"items": len(entries), "bytes": sum(x[1] for x in entries), "hits": self.hits, "misses": self.misses}
@@ -4,42 +4,81 @@ from dash.exceptions import PreventUpdate
 from dash import dcc,ALL,ctx,ClientsideFunction
 import io
 import base64
-import pandas as pd
-import band_plot_utils
-import utilfuncs
-import plotly.graph_objs as go
-import numpy as np
+import config
+import render
+import render_cache
+import background
+import instrumentation
 
 mw_column_name = 'kDa'
+data_unavailable_message = "The data of this image are no longer kept on the server. Please load the file and generate the image again."
 
 def parse_contents(contents, filename):
-    content_type, content_string = contents.split(',')
-    decoded = base64.b64decode(content_string)
-    try:
-        if filename.endswith('.csv'):
-            df = pd.read_csv(io.StringIO(decoded.decode('utf-8')))
-        elif filename.endswith(('.txt','.tsv')):
-            df = pd.read_csv(io.StringIO(decoded.decode('utf-8')), delimiter = '\t')
-        elif filename.endswith(('.xlsx', '.xls')):
-            df = pd.read_excel(io.BytesIO(decoded))
-        else:
-            return None, None
-    except:
-        return None, None
-
-    data = df.to_dict('records')
-    keys = [{'name': i, 'id': i} for i in df.columns]
-
-    return keys, data
-
-def treat_blank_as_0(data: list[dict]) -> set:
-    blank_contain_series = set()
-    for i in range(len(data)):
-        for key, val in data[i].items():
-            if isinstance(val, str) and len(val.strip()) == 0:
-                data[i][key] = 0
-                blank_contain_series.add(key)
-    return blank_contain_series
+    # contents: "data:<content type>;base64,<data>"
+    # The decoded bytes are parsed in place (io.BytesIO shares the buffer), without decoding them into a str.
+    import data_loader
+    decoded = base64.b64decode(contents[contents.index(',') + 1:])
+    stats = {} if config.report_upload_memory else None
+    df = data_loader.read_data(io.BytesIO(decoded), filename, stats = stats)
+    if stats != None:
+        print("{}: {:.1f} MB parsed in {:.3f} s, peak memory {:.1f} MB".format(
+            filename, len(decoded) / 1024 / 1024, stats["parse_time"], stats["peak_memory"] / 1024 / 1024))
+    return df
+
+def render_full_resolution(render_request) -> bytes | None:
+    # render_request: {"dataset": dataset reference, "render_settings": render settings} stored at generation.
+    # The data are taken from the dataset store, or decoded from the columnar blocks if the reference carries them.
+    # Returns None if neither has them (e.g. expired).
+    # Otherwise returns the image encoded in config.download_format. The encoded bytes are kept in the render cache,
+    # so the downloads are served from the server side without re-encoding.
+    import dataset_store
+    if not isinstance(render_request, dict):
+        return None
+    dataset_info = render_request["dataset"]
+    encoding = render.make_encoding(config.download_format)
+    render_key = render_cache.make_render_key(dataset_info["dataset_id"], render_request["render_settings"], encoding)
+    image_bytes = render_cache.render_cache.get(render_key)
+    if image_bytes == None:
+        dataframe = dataset_store.get_dataframe(dataset_info)
+        if dataframe is None:
+            return None
+        image_bytes = render.encode_image(render.render_image(dataframe, render_request["render_settings"], dataset_info["dataset_id"]), encoding)
+        render_cache.render_cache.put(render_key, image_bytes, {"full_resolution": True})
+    return image_bytes
+
+def get_download_image_name(fileinfo):
+    from pathlib import Path
+    return "image_{}{}".format(Path(fileinfo['filename']).stem, render.image_formats[config.download_format]["extension"])
+
+
+def update_table_page(dataset_info, page_current, page_size, sort_by, filter_query, table_id):
+    # Only the rows of the current page are sent (filtered and sorted on the server).
+    # New data, filter or sort order: back to the first page.
+    import dataset_store
+    if dataset_info == None:
+        raise PreventUpdate
+    if page_current == None or "{}.page_current".format(table_id) not in dash.ctx.triggered_prop_ids:
+        page_current = 0
+    data, n_rows = dataset_store.get_page(dataset_info, page_current, page_size, sort_by, filter_query)
+    if data == None:
+        raise PreventUpdate
+    return data, dataset_store.calc_page_count(n_rows, page_size), page_current
+
+def update_signal_graph(dataset_info, relayout_data, zoomed, previous_view):
+    import dataset_store
+    import signal_graph
+    df = dataset_store.get_dataframe(dataset_info)
+    if df is None or len(df) == 0:
+        raise PreventUpdate
+    if mw_column_name not in df.columns:
+        raise PreventUpdate
+    x_window = None
+    if zoomed == True:
+        if len(df) <= config.graph_point_budget:
+            # All points are already shown.
+            raise PreventUpdate
+        x_window = signal_graph.parse_x_window(relayout_data)
+    return signal_graph.build_figure(dataset_info["dataset_id"], df, previous_view, x_window, zoomed)
 
 
 def callbacks(_app: dash.Dash, default_values):
@@ -49,51 +88,71 @@ def callbacks(_app: dash.Dash, default_values):
     @_app.callback(
         Output('uploaded_filename', 'children'),
         Output('raw_data_table', 'columns'),
-        Output('raw_data_table', 'data'),
+        Output('store_raw_dataset', 'data'),
         Output('store_fileinfo', 'data'),
         Input('upload_data', 'contents'),
         State('upload_data', 'filename'),
         prevent_initial_call = True
     )
     def upload_file(contents, filename):
+        import data_loader
+        import dataset_store
         if contents is not None:
-            keys, data = parse_contents(contents, filename)
-            if keys == None or data == None:
+            df = parse_contents(contents, filename)
+            if df is None:
                 return "Invalid Data.", dash.no_update, dash.no_update, dash.no_update
+            keys = [{'name': i, 'id': i} for i in df.columns]
             
             if keys[0]['id'] != 'kDa':
                 message = "The first column must be 'kDa'."
                 return message, dash.no_update, dash.no_update, dash.no_update
 
             # Blank check
-            message = f"{filename}: ({len(keys) - 1} signal series * {len(data)} points)"
+            message = f"{filename}: ({len(keys) - 1} signal series * {len(df)} points)"
             #message = "{} is loaded. It conteines {} columns. The data is shown in 'Loaded Data' tab.".format(filename, len(keys))
-            blank_contain_series = treat_blank_as_0(data) 
+            df, blank_contain_series = data_loader.fill_blank_cells(df)
             if 0 < len(blank_contain_series):
                 #message2 = " Note: {} contained blank cells. These blank cells will be treated as 0.".format(blank_contain_series)
                 message2 = f"Note: The series {', '.join(blank_contain_series)} contains blank cells."
                 message += "\n"
                 message += message2
-            return message, keys, data, {'filename': filename}
+
+            # Keep the data on the server. Only the reference is sent to the browser.
+            raw_dataset = dataset_store.make_dataset_info(df)
+            return message, keys, raw_dataset, {'filename': filename}
         else:
             return "Invalid Operation!", dash.no_update, dash.no_update, dash.no_update
 
+    @_app.callback(
+        Output('raw_data_table', 'data'),
+        Output('raw_data_table', 'page_count'),
+        Output('raw_data_table', 'page_current'),
+        Input('store_raw_dataset', 'data'),
+        Input('raw_data_table', 'page_current'),
+        Input('raw_data_table', 'page_size'),
+        Input('raw_data_table', 'sort_by'),
+        Input('raw_data_table', 'filter_query'),
+        prevent_initial_call = True
+    )
+    def update_raw_data_table_page(raw_dataset, page_current, page_size, sort_by, filter_query):
+        return update_table_page(raw_dataset, page_current, page_size, sort_by, filter_query, "raw_data_table")
+
     #============================================================
     #   Generate Image
     #============================================================
-    @_app.callback(
+    @background.callback(
+        _app,
         Output('resulted_image', 'src'),
         Output('generate_message', 'children'),
         Output("generate_log", "value"),
+        Output('store_render_request', 'data'),
         Input('generate_button', 'n_clicks'),
         State('draw_type_radio', 'value'),
 
-        State('raw_data_table', 'columns'),
-        State('raw_data_table', 'data'),
+        State('store_raw_dataset', 'data'),
         State('asis_lane_setting_table', 'data'),
 
-        State('normalized_data_table', 'columns'),
-        State('normalized_data_table', 'data'),
+        State('store_normalized_dataset', 'data'),
 
         State('signal_limit_slider', 'value'),
         State('marker_switch', 'value'),
@@ -110,32 +169,49 @@ def callbacks(_app: dash.Dash, default_values):
         State({'type': "detailed_settings", "key": ALL}, "value" ),
 
         prevent_initial_call = True,
+        progress = [Output('generate_progress', 'value'), Output('generate_progress', 'label')],
+        running = [
+            (Output('generate_progress', 'style'), {}, {'display': 'none'}),
+            (Output('generate_cancel_button', 'style'), {}, {'display': 'none'}),
+        ],
+        cancel = [
+            Input('generate_cancel_button', 'n_clicks'),
+            Input('store_raw_dataset', 'data'),
+            Input('draw_type_radio', 'value'),
+            Input('asis_lane_setting_table', 'data'),
+        ],
     )
-    def generate_image(n_clicks, draw_type, 
-                       raw_columns, raw_data, asis_lane_setting_table_data,
-                       normalized_columns, normalized_data,
+    def generate_image(set_progress, n_clicks, draw_type, 
+                       raw_dataset, asis_lane_setting_table_data,
+                       normalized_dataset,
                        signal_limit, marker_switch, marker_mw_input, lane_label_select, lane_label_rotate,
                        draw_mw_range_switch, draw_mw_range_min, draw_mw_range_max, fileinfo,
                        detailed_settings_value_list):
+        import utilfuncs
+        import dataset_store
         # Process Arguments
         # XXX
         detailed_settings_id_list = [item['id']['key'] for item in ctx.states_list[-1]]
         detailed_settings = dict(zip(detailed_settings_id_list, detailed_settings_value_list))
 
         log_stream_details = io.StringIO()
+        timings = {}
 
         if draw_type == "as_is":
-            data = raw_data
-            columns = raw_columns
+            dataset_info = raw_dataset
         elif draw_type == "normalized_new":
-            data = normalized_data
-            columns = normalized_columns
+            dataset_info = normalized_dataset
 
-        if data == None or len(data) == 0:
+        if dataset_info == None:
             raise PreventUpdate
 
-        column_names = [ x['name'] for x in columns ]
-        dataframe = pd.DataFrame.from_records(data, columns = column_names)
+        with instrumentation.stage("generate_image", "data", timings):
+            dataframe = dataset_store.get_dataframe(dataset_info)
+        if dataframe is None:
+            return None, "Error: The data is no longer available on the server. Please upload the file again.", "", None
+        if len(dataframe) == 0:
+            raise PreventUpdate
+        column_names = list(dataframe.columns)
         
         # set plot indices
         plot_indices = []
@@ -150,15 +226,12 @@ def callbacks(_app: dash.Dash, default_values):
         #XXX
         if signal_limit == 0:
             signal_limit = None
-        print("Signal Limit:\t{}".format("Not specified" if signal_limit == None else signal_limit), file = log_stream_details)
-
-        plot_obj = band_plot_utils.WesternBlotPlotUtil(dataframe, plot_indices, offset = 40)
 
         # Prepare labels
         plot_label_flag = False
+        plot_labels = []
         if lane_label_select != None:
             plot_label_flag = True
-            plot_labels = []
             if lane_label_select == "lane_number":
                 for i in range(len(asis_lane_setting_table_data)):
                     plot_labels.append("{}".format(i+1))
@@ -168,13 +241,12 @@ def callbacks(_app: dash.Dash, default_values):
             elif lane_label_select == "sample_name":
                 for record in asis_lane_setting_table_data:
                     plot_labels.append(record["sample_name"])
-            plot_obj.set_plot_labels(plot_labels)
         
 
         # Molecular Weight Range
+        mw_range = None
         if draw_mw_range_switch == True:
-            plot_obj.set_molecular_weight_range(draw_mw_range_min, draw_mw_range_max)
-            print("Draw Range: \t Min: {} kDa, Max: {} kDa".format(draw_mw_range_min, draw_mw_range_max), file = log_stream_details)
+            mw_range = [draw_mw_range_min, draw_mw_range_max]
 
         #MW marker
         draw_marker_line = False
@@ -189,10 +261,9 @@ def callbacks(_app: dash.Dash, default_values):
         if draw_marker_line == True or write_text == True:
             if marker_mw_input != None and isinstance(marker_mw_input, str) and 0 < len(marker_mw_input):
                 try:
-                    parsed = utilfuncs.parse_labeled_numbers(marker_mw_input)
-                    plot_obj.set_marker_molecular_weights(parsed)
+                    marker_mw_list = utilfuncs.parse_labeled_numbers(marker_mw_input)
                 except ValueError as e:
-                    return None, "Error: Molecular Weights are invalid.", ""
+                    return None, "Error: Molecular Weights are invalid.", "", None
 
         #--------------------------------------------------
         # Detailed Settings
@@ -200,79 +271,100 @@ def callbacks(_app: dash.Dash, default_values):
         if "band_width_switch" in detailed_settings and detailed_settings["band_width_switch"] == True:
             band_width = detailed_settings["band_width"]
             band_spacing = detailed_settings["band_spacing"]
-            plot_obj.set_band_width(band_width, band_spacing)
-            print("Band Width:\t {} px".format(band_width), file = log_stream_details)
-            print("Band Spacing:\t {} px".format(band_spacing), file = log_stream_details)
         else:
-            plot_obj.set_band_width(default_values["band_width"], default_values["band_spacing"])
+            band_width = default_values["band_width"]
+            band_spacing = default_values["band_spacing"]
         if "offset_switch" in detailed_settings and detailed_settings["offset_switch"] == True:
             offset_top = detailed_settings["offset_top"]
             offset_bottom = detailed_settings["offset_bottom"]
             offset_left = detailed_settings["offset_left"]
             offset_right = detailed_settings["offset_right"]
-            plot_obj.set_offset(offset_left = offset_left,offset_right = offset_right,
-                                offset_top = offset_top, offset_bottom=offset_bottom)
-            print("Margin Top:\t {} px".format(offset_top), file = log_stream_details)
-            print("Margin Bottom:\t{} px".format(offset_bottom), file = log_stream_details)
-            print("Margin Left:\t {} px".format(offset_left), file = log_stream_details)
-            print("Margin Right:\t {} px".format(offset_right), file = log_stream_details)
         else:
-            plot_obj.set_offset(
-                offset_top = default_values["offset_top"], offset_bottom = default_values["offset_bottom"],
-                offset_left= default_values["offset_left"],offset_right = default_values["offset_right"]
-            )
+            offset_top = default_values["offset_top"]
+            offset_bottom = default_values["offset_bottom"]
+            offset_left = default_values["offset_left"]
+            offset_right = default_values["offset_right"]
         if "label_font_size_switch" in detailed_settings and detailed_settings["label_font_size_switch"] == True:
             lane_label_size = detailed_settings["lane_label_size"]
             mw_label_size = detailed_settings["mw_label_size"]
-            plot_obj.set_font_size(lane_label_size, mw_label_size)
-            print("Lane Label Size:\t {} pt".format(lane_label_size), file = log_stream_details)
-            print("Molecular Weights Label Size:\t {} pt".format(mw_label_size), file = log_stream_details)
         else:
-            plot_obj.set_font_size(label_font_size = default_values["lane_label_size"], marker_font_size = default_values["mw_label_size"])
+            lane_label_size = default_values["lane_label_size"]
+            mw_label_size = default_values["mw_label_size"]
+
+        render_settings = {
+            "plot_indices": plot_indices,
+            "plot_labels": plot_labels,
+            "write_label": plot_label_flag,
+            "rotate_label": lane_label_rotate,
+            "signal_limit": signal_limit,
+            "mw_range": mw_range,
+            "draw_marker_line": draw_marker_line,
+            "write_text": write_text,
+            "marker_molecular_weights": marker_mw_list,
+            "band_width": band_width,
+            "band_spacing": band_spacing,
+            "offset_top": offset_top,
+            "offset_bottom": offset_bottom,
+            "offset_left": offset_left,
+            "offset_right": offset_right,
+            "lane_label_size": lane_label_size,
+            "mw_label_size": mw_label_size,
+            "field_height": None,
+            "pooling": "max",
+        }
+        log_stream_details.write(render.describe_render_settings(render_settings))
 
         #--------------------------------------------------
-        #   Finally, Generate Band Image
+        #   Finally, Generate Band Image (or reuse the same image generated before)
         #--------------------------------------------------
-        plot_obj.draw_bands(
-                signal_max = signal_limit, 
-                draw_marker_line = draw_marker_line, 
-                write_text = write_text, rotate_label = lane_label_rotate,
-                write_label=plot_label_flag)
-
-        img = plot_obj.get_image_obj()
-        img_byte_arr = io.BytesIO()
-        img.save(img_byte_arr, format = 'PNG')
-        encoded_img = base64.b64encode(img_byte_arr.getvalue()).decode('utf-8')
-
-        log_stream = io.StringIO()
-        from datetime import datetime
-        now = datetime.now()
-        print("DateTime: {}".format(now), file = log_stream)
-        print("DataFile: {}".format(fileinfo['filename']), file = log_stream)
-        print("Drawing Mode: {}".format("As Is" if draw_type == "as_is" else "Normalized"), file = log_stream)
-        print("", file = log_stream)    # insert blank line
-        print("Lane Order", file = log_stream)
-        for lane_index, record in enumerate(asis_lane_setting_table_data):
-            print("{}\t{}\t{}".format(
-                lane_index+1, 
-                record["sample_name"],
-                record["label"] if record["label"] and 0 < len(record["label"]) else ""
-            ), file = log_stream)
-        print("", file = log_stream)    # insert blank line
-        
-        log_text = log_stream.getvalue()   
-        log_stream.close()
-
-        log_text += log_stream_details.getvalue()
+        # The preview is rendered at most config.preview_field_height rows.
+        # The full resolution image is rendered when it is downloaded (see render_full_resolution()).
+        preview_encoding = render.make_encoding(config.preview_format)
+        download_encoding = render.make_encoding(config.download_format)
+        render_key = render_cache.make_render_key(dataset_info["dataset_id"], render_settings, download_encoding)
+        preview_settings = render_settings
+        if config.preview_field_height != 0:
+            preview_settings = dict(render_settings, field_height = config.preview_field_height)
+        preview_key = render_cache.make_render_key(dataset_info["dataset_id"], preview_settings, preview_encoding)
+        # The entry tells whether the preview is resampled (full_resolution == False).
+        preview_entry = render_cache.render_cache.get_entry(preview_key)
+        if preview_entry == None:
+            with background.worker_slot(on_wait = lambda: set_progress((0, "Waiting for a free worker"))):
+                set_progress((10, "Rendering"))
+                render_stats = {}
+                with instrumentation.stage("generate_image", "draw", timings):
+                    img, full_resolution = render.render_preview(dataframe, render_settings, config.preview_field_height, dataset_info["dataset_id"], render_stats)
+                log_stream_details.write(render.describe_render_stats(render_stats))
+                set_progress((70, "Encoding"))
+                with instrumentation.stage("generate_image", "encode", timings):
+                    png_bytes = render.encode_image(img, preview_encoding)
+            render_cache.render_cache.put(preview_key, png_bytes, {"full_resolution": full_resolution})
+            if full_resolution == True and preview_key != render_key and preview_encoding == download_encoding:
+                render_cache.render_cache.put(render_key, png_bytes, {"full_resolution": True})
+        else:
+            png_bytes = preview_entry[0]
+            full_resolution = preview_entry[1].get("full_resolution", True)
+        with instrumentation.stage("generate_image", "base64", timings):
+            encoded_img = base64.b64encode(png_bytes).decode('utf-8')
+
+        message = ""
+        if full_resolution == False:
+            message = "This is a preview resampled to {} px height. The downloaded image has the full resolution.".format(config.preview_field_height)
+
+        if config.log_timings == True:
+            log_stream_details.write(instrumentation.describe_timings(timings))
+        log_text = render.make_log_text(fileinfo['filename'], draw_type, asis_lane_setting_table_data, log_stream_details.getvalue())
         log_stream_details.close()
-        return f"data:image/png;base64,{encoded_img}", "", log_text
+        # Only the reference (dataset_id, columns, n_rows) if the data are shared among workers: the store is sent back at every download.
+        render_request = {"dataset": dataset_store.make_dataset_reference(dataset_info, dataframe), "render_settings": render_settings}
+        return "data:{};base64,{}".format(render.image_formats[config.preview_format]["mime_type"], encoded_img), message, log_text, render_request
 
     #================================================================================
     #   When New File is Loaded
     #================================================================================
     @_app.callback(
         Output('asis_lane_setting_table', 'data'),
-        Input('raw_data_table', 'data'),
+        Input('store_raw_dataset', 'data'),
         Input('raw_data_table', 'columns'),
         Input('add_lane_button', 'n_clicks'),
         Input('lane_reset_button', 'n_clicks'),
@@ -282,13 +374,13 @@ def callbacks(_app: dash.Dash, default_values):
         State('asis_lane_setting_table', 'selected_rows'),
         prevent_initial_call = True,
     )
-    def update_asis_lane_setting_table(data, columns, 
+    def update_asis_lane_setting_table(raw_dataset, columns, 
                                        n_clicks_add_lane_button, n_clicks_lane_reset_button,
                                        n_clicks_lane_clear_button, n_clicks_lane_insert_button,
                                        lane_setting_data, selected_rows):
         if columns == None or isinstance(columns, list) == False:
             raise PreventUpdate
-        if dash.ctx.triggered_id in {"raw_data_table", "lane_reset_button"}:
+        if dash.ctx.triggered_id in {"store_raw_dataset", "raw_data_table", "lane_reset_button"}:
             ret = []
             for i, column in enumerate(columns):
                 if not column['id'] == mw_column_name:
@@ -340,17 +432,19 @@ def callbacks(_app: dash.Dash, default_values):
 
     @_app.callback(
         Output('download_image', 'data'),
+        Output('generate_message', 'children', allow_duplicate = True),
         Input('download_button', 'n_clicks'),
-        State('resulted_image', 'src'),
+        State('store_render_request', 'data'),
         State('store_fileinfo', 'data'),
         prevent_initial_call = True
     )
-    def update_download(n_clicks, image_src, fileinfo):
-        if n_clicks and image_src:
-            from pathlib import Path
-            filename_stem = Path(fileinfo['filename']).stem
-            return dict(content=image_src.split(",")[1], filename="image_{}.png".format(filename_stem), base64=True)
-        return dash.no_update
+    def update_download(n_clicks, render_request, fileinfo):
+        if n_clicks and render_request:
+            image_bytes = render_full_resolution(render_request)
+            if image_bytes == None:
+                return dash.no_update, data_unavailable_message
+            return dcc.send_bytes(image_bytes, get_download_image_name(fileinfo)), dash.no_update
+        return dash.no_update, dash.no_update
 
     @_app.callback(
         Output('download_log', 'data'),
@@ -367,99 +461,95 @@ def callbacks(_app: dash.Dash, default_values):
 
     @_app.callback(
         Output('download_all', 'data'),
+        Output('generate_message', 'children', allow_duplicate = True),
         Input('download_all_button', 'n_clicks'),
-        State('resulted_image', 'src'),
+        State('store_render_request', 'data'),
         State('generate_log', 'value'),
         State('store_fileinfo', 'data'),
         prevent_initial_call = True
     )
-    def download_all_in_zip(n_clicks, base64_image_src, log_text, fileinfo):
+    def download_all_in_zip(n_clicks, render_request, log_text, fileinfo):
         import zipfile
+        image_bytes = render_full_resolution(render_request)
+        if image_bytes == None:
+            return dash.no_update, data_unavailable_message
         zip_buffer = io.BytesIO()
 
         from pathlib import Path
         filename_stem = Path(fileinfo['filename']).stem
 
         with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
-            if base64_image_src:
-                if ',' in base64_image_src:
-                    base64_data = base64_image_src.split(',')[1]
-                else:
-                    base64_data = base64_image_src
-                image_bytes = base64.b64decode(base64_data)
-                zf.writestr('image_{}.png'.format(filename_stem), image_bytes)
+            # The image is already compressed.
+            zf.writestr(get_download_image_name(fileinfo), image_bytes, compress_type = zipfile.ZIP_STORED)
             zf.writestr('log_{}.txt'.format(filename_stem), log_text or '')
         zip_buffer.seek(0)
-        return dcc.send_bytes(zip_buffer.getvalue(), '{}.zip'.format(filename_stem))
+        return dcc.send_bytes(zip_buffer.getvalue(), '{}.zip'.format(filename_stem)), dash.no_update
         
 
     @_app.callback(
         Output('graph', 'figure'),
-        Input('raw_data_table', 'data'),
-        Input('raw_data_table', 'columns'),
+        Output('store_graph_view', 'data'),
+        Input('store_raw_dataset', 'data'),
+        Input('graph', 'relayoutData'),
+        State('store_graph_view', 'data'),
         prevent_initial_call = True
     )
-    def update_graph(raw_data, raw_data_columns):
-        if isinstance(raw_data_columns, list) != True:
-            raise PreventUpdate
-        if raw_data == None or len(raw_data) == 0:
-            raise PreventUpdate
-        column_names = [ x['name'] for x in raw_data_columns ]
-        if mw_column_name in column_names == False:
-            raise PreventUpdate
-        
-        df = pd.DataFrame.from_records(raw_data, columns = column_names)
-        x_uniform = np.linspace(0, 1, len(raw_data))
-        fig = go.Figure()
-        for column in column_names:
-            if column == mw_column_name:
-                continue
-            fig.add_trace(go.Scatter(
-                x = x_uniform, y = df[column], name = column, showlegend=True, 
-                text=df[mw_column_name],
-                hovertemplate= column + '<br>x: %{text}<br>y: %{y}<extra></extra>' )
-            )
-        fig.update_layout(
-            xaxis=dict(
-                tickvals = x_uniform[::10],
-                ticktext = df[mw_column_name][::10],
-            )
-        )
-        return fig
+    def update_graph(raw_dataset, relayout_data, graph_view):
+        return update_signal_graph(raw_dataset, relayout_data, ctx.triggered_id == 'graph', graph_view)
             
     @_app.callback(
         Output('graph_normalized', 'figure'),
-        Input('normalized_data_table', 'data'),
-        Input('normalized_data_table', 'columns'),
+        Output('store_graph_normalized_view', 'data'),
+        Input('store_normalized_dataset', 'data'),
+        Input('graph_normalized', 'relayoutData'),
+        State('store_graph_normalized_view', 'data'),
         prevent_initial_call = True
     )
-    def update_calculated_graph(calculated_data, calculated_data_columns):
-        if isinstance(calculated_data_columns, list) != True:
-            raise PreventUpdate
-        if calculated_data == None or len(calculated_data) == 0:
+    def update_calculated_graph(normalized_dataset, relayout_data, graph_view):
+        return update_signal_graph(normalized_dataset, relayout_data, ctx.triggered_id == 'graph_normalized', graph_view)
+
+    #================================================================================
+    #   Normalized Data Table
+    #================================================================================
+    @_app.callback(
+        Output('normalized_data_table', 'data'),
+        Output('normalized_data_table', 'page_count'),
+        Output('normalized_data_table', 'page_current'),
+        Input('store_normalized_dataset', 'data'),
+        Input('normalized_data_table', 'page_current'),
+        Input('normalized_data_table', 'page_size'),
+        Input('normalized_data_table', 'sort_by'),
+        Input('normalized_data_table', 'filter_query'),
+        prevent_initial_call = True
+    )
+    def update_normalized_data_table_page(normalized_dataset, page_current, page_size, sort_by, filter_query):
+        return update_table_page(normalized_dataset, page_current, page_size, sort_by, filter_query, "normalized_data_table")
+
+    _app.clientside_callback(
+        ClientsideFunction(namespace="common", function_name="false_if_value_is_not_null"),
+        Output("normalized_data_export_button", "disabled"),
+        Input('store_normalized_dataset', 'data'),
+    )
+
+    @_app.callback(
+        Output('download_normalized_data', 'data'),
+        Input('normalized_data_export_button', 'n_clicks'),
+        State('store_normalized_dataset', 'data'),
+        State('normalized_data_table', 'sort_by'),
+        State('normalized_data_table', 'filter_query'),
+        State('store_fileinfo', 'data'),
+        prevent_initial_call = True
+    )
+    def download_normalized_data(n_clicks, normalized_dataset, sort_by, filter_query, fileinfo):
+        import dataset_store
+        if not n_clicks:
             raise PreventUpdate
-        column_names = [ x['name'] for x in calculated_data_columns ]
-        if mw_column_name in column_names == False:
+        df = dataset_store.get_table_dataframe(normalized_dataset, sort_by, filter_query)
+        if df is None:
             raise PreventUpdate
-        
-        df = pd.DataFrame.from_records(calculated_data, columns = column_names)
-        x_uniform = np.linspace(0, 1, len(calculated_data))
-        fig = go.Figure()
-        for column in column_names:
-            if column == mw_column_name:
-                continue
-            fig.add_trace(go.Scatter(
-                x = x_uniform, y = df[column], name = column, showlegend=True, 
-                text=df[mw_column_name],
-                hovertemplate= column + '<br>x: %{text}<br>y: %{y}<extra></extra>' )
-            )
-        fig.update_layout(
-            xaxis=dict(
-                tickvals = x_uniform[::10],
-                ticktext = df[mw_column_name][::10],
-            )
-        )
-        return fig
+        from pathlib import Path
+        filename_stem = Path(fileinfo['filename']).stem if isinstance(fileinfo, dict) else "data"
+        return dcc.send_data_frame(df.to_excel, "normalized_{}.xlsx".format(filename_stem), index = False)
 
     #================================================================================
     #   Switch the Enable/Disable Interfaces
@@ -518,9 +608,9 @@ def callbacks(_app: dash.Dash, default_values):
     lane_order_handle_buttons =  ['add_lane_button', 'lane_reset_button', 'lane_clear_button', 'lane_insert_button']
     for button_id in lane_order_handle_buttons:
         _app.clientside_callback(
-            ClientsideFunction(namespace="common", function_name="false_if_value_is_not_empty_list"),
+            ClientsideFunction(namespace="common", function_name="false_if_value_is_not_null"),
             Output(button_id, "disabled"),
-            Input('raw_data_table', 'data'),
+            Input('store_raw_dataset', 'data'),
         )
 
     #------------------------------------------------------------
@@ -530,8 +620,8 @@ def callbacks(_app: dash.Dash, default_values):
         ClientsideFunction(namespace="ui_disable", function_name="generate_button_disable"),
         Output("generate_button", "disabled"),
         Input("draw_type_radio", "value"),
-        Input("raw_data_table", "data"),
-        Input("normalized_data_table", "data"),
+        Input("store_raw_dataset", "data"),
+        Input("store_normalized_dataset", "data"),
         Input("draw_mw_range_switch", "value"),
         Input("draw_mw_range_min", "value"),
         Input("draw_mw_range_max", "value"),
@@ -553,6 +643,7 @@ def callbacks(_app: dash.Dash, default_values):
         prevent_initial_call = True,
     )
     def update_marker_mw_input_valid(value):
+        import utilfuncs
         if value == None:
             return False
         elif len(value) == 0:
@@ -2,8 +2,7 @@ import dash
 from dash.dependencies import Output, Input, State
 from dash.exceptions import PreventUpdate
 from dash import html,ALL,ctx,ClientsideFunction
-import pandas as pd
-import utilfuncs
+import background
 
 mw_column_name = 'kDa'
 def callback_normalization(_app: dash.Dash, default_values):
@@ -13,7 +12,7 @@ def callback_normalization(_app: dash.Dash, default_values):
     @_app.callback(
         Output("lane_relationship_table", "data"),
         Output("expand_display_p", "children"),
-        Input('raw_data_table', 'data'),
+        Input('store_raw_dataset', 'data'),
         Input('raw_data_table', 'columns'),
         Input('set_relationship_by_specifier_button', 'n_clicks'),
         Input('lane_relationship_table_reset_button', 'n_clicks'),
@@ -22,12 +21,13 @@ def callback_normalization(_app: dash.Dash, default_values):
         State("total_lane_specifier", "value"),
         State("target_lane_specifier", "value"),
     )
-    def update_normalization_table(raw_data, raw_data_columns, 
+    def update_normalization_table(raw_dataset, raw_data_columns, 
                                    n_clicks_set_specifier, n_clicks_lane_relationship_table_reset,
                                    current_data, total_lane_specifier, target_lane_specifier):
-        if isinstance(raw_data, list) == False or len(raw_data) == 0:
+        import utilfuncs
+        if isinstance(raw_dataset, dict) == False or isinstance(raw_data_columns, list) == False:
             raise PreventUpdate
-        if dash.ctx.triggered_id == "raw_data_table" or dash.ctx.triggered_id == "lane_relationship_table_reset_button":
+        if dash.ctx.triggered_id in {"store_raw_dataset", "raw_data_table", "lane_relationship_table_reset_button"}:
             ret = [{"index": i+1, "sample_name": column["name"], "type": "Target", "associated_lane": None} for (i, column) in enumerate(filter(lambda x: x["name"] != mw_column_name, raw_data_columns))]
             return ret, None
 
@@ -99,96 +99,94 @@ def callback_normalization(_app: dash.Dash, default_values):
 
     @_app.callback(
         Output("normalization_target_dropdown", "value"),
-        Input('raw_data_table', 'data'),
+        Input('store_raw_dataset', 'data'),
     )
     def update_normalization_target_dropdown(data):
         return None
 
-    @_app.callback(
-        Output("normalized_data_table", "data"),
+    @background.callback(
+        _app,
         Output("normalized_data_table", "columns"),
         Output("normalization_result_table", "data"),
+        Output("store_normalized_dataset", "data"),
         Input("calculate_normalized_signal_button", "n_clicks"),
-        Input('raw_data_table', 'data'),
-        Input('raw_data_table', 'columns'),
+        State('store_raw_dataset', 'data'),
         State("normalization_target_dropdown", "value"),
         State("lane_relationship_table", "data"),
         State("signal_calculation_range_switch", "value"),
         State("signal_calculation_range_min", "value"),
         State("signal_calculation_range_max", "value"),
         State("stop_summation_negative_value", "value"),
+        prevent_initial_call = True,
+        progress = [Output('calculate_progress', 'value'), Output('calculate_progress', 'label')],
+        running = [
+            (Output('calculate_progress', 'style'), {}, {'display': 'none'}),
+            (Output('calculate_cancel_button', 'style'), {}, {'display': 'none'}),
+        ],
+        cancel = [
+            Input('calculate_cancel_button', 'n_clicks'),
+            Input('store_raw_dataset', 'data'),
+            Input("lane_relationship_table", "data"),
+        ],
     )
-    def calculate_normalization(n_clicks, raw_data, raw_data_columns, normalization_target, lane_relationship,
+    def calculate_normalization(set_progress, n_clicks, raw_dataset, normalization_target, lane_relationship,
                                 signal_calculation_range_switch, signal_range_min, signal_range_max, stop_summation_negative):
-        if dash.ctx.triggered_id == "raw_data_table":
-            # Clear
-            raise PreventUpdate
-        if raw_data == None or raw_data_columns == None:
+        import dataset_store
+        import normalization
+        if raw_dataset == None:
             raise PreventUpdate
         if normalization_target == None:
             raise PreventUpdate
 
-        column_names = [x['name'] for x in raw_data_columns]
-        #----------------------------------------
-        # If signal calculation range is set, extract the dataframe between the region
-        #----------------------------------------
+        raw_dataframe = dataset_store.get_dataframe(raw_dataset)
+        if raw_dataframe is None:
+            raise PreventUpdate
+        signal_range = None
         if signal_calculation_range_switch == True:
-            extracted_data = filter(lambda x: signal_range_min <= x[mw_column_name] <= signal_range_max, raw_data)
-            dataframe = pd.DataFrame.from_records(extracted_data, columns = column_names)
-        else:
-            dataframe = pd.DataFrame.from_records(raw_data, columns = column_names)
-
-        #----------------------------------------
-        # First, calculate the signal sums
-        #----------------------------------------
-        signal_sums = {}
-        if stop_summation_negative == True:
-            signal_sums = utilfuncs.calc_signal_sum_positive_region(dataframe)
-        else:
-            signal_sums = utilfuncs.calc_signal_sum(dataframe)
-
-        #----------------------------------------
-        # Second, calculate the normalize factors
-        #----------------------------------------
-        total_protein_columns = [x["sample_name"] for x in filter(lambda x: x["type"] == "Total",lane_relationship)]
-        ref_signal = signal_sums[normalization_target]
-        factors = {x: ref_signal/signal_sums[x] if float(signal_sums[x]) != float(0) else 0 for x in total_protein_columns}
-
-        used_factors = {}
-        #----------------------------------------
-        # Finally, calculate the resulted signal
-        #----------------------------------------
-        result_df = pd.DataFrame()
-        result_df[mw_column_name] = dataframe[mw_column_name]
-        for record in lane_relationship:
-            sample_name = record["sample_name"]
-            factor = 1.0;
-            if record['type'] == "Total":
-                factor = factors[sample_name]
-            elif record['type'] == "Target":
-                if "associated_lane" in record:
-                    associated_lane = record["associated_lane"]
-                    if associated_lane != None and associated_lane in factors:
-                        factor = factors[associated_lane]
-            scaled_signal = factor * dataframe.loc[:,sample_name]
-            result_df[sample_name] = scaled_signal
-            used_factors[sample_name] = factor
-        
-        # Pack for Data Table
-        result_data = result_df.to_dict('records')
-        result_columns = [{'name': i, 'id': i} for i in result_df.columns]
-        #========================================
-        # Normalization Summary
-        #========================================
-        is_reference = lambda x: True if (x["type"] == "Total" and x["sample_name"] == normalization_target) or (x["type"] == "Target" and x["associated_lane"] == normalization_target) else None
-        msg_func = lambda x: "Reference" if is_reference(x) else ("Not Normalized" if float(used_factors[x["sample_name"]]) == float(1) else "Blank" if signal_sums[x["sample_name"]] == 0 else "")
-        ret = [{"sample_name": x["sample_name"], 
-                "raw_total_signal": signal_sums[x["sample_name"]],
-                "factor": used_factors[x["sample_name"]],
-                "note": msg_func(x) } for x in lane_relationship]
-
-        return result_data, result_columns, ret
+            signal_range = (signal_range_min, signal_range_max)
+        with background.worker_slot(on_wait = lambda: set_progress((0, "Waiting for a free worker"))):
+            set_progress((10, "Calculating"))
+            result_df, ret = normalization.normalize(raw_dataframe, lane_relationship, normalization_target,
+                                                     signal_range = signal_range, stop_summation_negative = stop_summation_negative)
+
+            # The table shows the pages of the stored result.
+            set_progress((60, "Storing the result"))
+            result_columns = [{'name': i, 'id': i} for i in result_df.columns]
+            normalized_dataset = dataset_store.make_dataset_info(result_df)
+        return result_columns, ret, normalized_dataset
+
+
+    #--------------------------------------------------
+    #   Update the summary while the integration range is changed
+    #--------------------------------------------------
+    @_app.callback(
+        Output("normalization_result_table", "data", allow_duplicate = True),
+        Input("normalization_target_dropdown", "value"),
+        Input("signal_calculation_range_switch", "value"),
+        Input("signal_calculation_range_min", "value"),
+        Input("signal_calculation_range_max", "value"),
+        Input("stop_summation_negative_value", "value"),
+        State('store_raw_dataset', 'data'),
+        State("lane_relationship_table", "data"),
+        prevent_initial_call = True,
+    )
+    def update_normalization_summary(normalization_target, signal_calculation_range_switch, signal_range_min, signal_range_max,
+                                     stop_summation_negative, raw_dataset, lane_relationship):
+        import dataset_store
+        import normalization
+        if normalization_target == None or raw_dataset == None or isinstance(lane_relationship, list) == False:
+            raise PreventUpdate
+        signal_range = None
+        if signal_calculation_range_switch == True:
+            if signal_range_min == None or signal_range_max == None or signal_range_max < signal_range_min:
+                raise PreventUpdate
+            signal_range = (signal_range_min, signal_range_max)
 
+        signal_sum_index = dataset_store.get_signal_sum_index(raw_dataset)
+        if signal_sum_index == None:
+            raise PreventUpdate
+        return normalization.summarize(signal_sum_index, lane_relationship, normalization_target,
+                                       signal_range = signal_range, stop_summation_negative = stop_summation_negative)
 
     _app.clientside_callback(
         ClientsideFunction(namespace="common", function_name="negate"),
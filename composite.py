@@ -0,0 +1,72 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+
+import render
+import glyph_cache
+
+############################################################
+#  Composite of many band images in a grid (independent of Dash)
+############################################################
+# panels: list of {"title": str, "dataframe": DataFrame, "render_settings": render settings}
+#
+# The panels are rendered in threads and pasted into one canvas (no PNG encoding in between).
+# The panels of a grid row share the MW axis: only the first panel of the row draws the markers,
+# and the others are put next to it without the left margin. For the bands to line up, the panels
+# should have the same kDa values, MW range, margins and field height (e.g. capillaries of one plate).
+title_font_size = 16
+title_margin = 8
+
+def make_panel_settings(render_settings, first_in_row):
+    if first_in_row == True:
+        return render_settings
+    return dict(render_settings, draw_marker_line = False, write_text = False, offset_left = 0)
+
+def render_panels(panels, columns, max_workers = None):
+    # Returns the images of the panels in the same order.
+    def render_panel(i_panel):
+        panel = panels[i_panel]
+        settings = make_panel_settings(panel["render_settings"], i_panel % columns == 0)
+        return render.render_image(panel["dataframe"], settings)
+    if max_workers == None:
+        max_workers = min(len(panels), os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers = max(1, max_workers)) as executor:
+        return list(executor.map(render_panel, range(len(panels))))
+
+def calc_title_height():
+    ascent, descent = glyph_cache.get_metrics(title_font_size)
+    return ascent + descent + title_margin
+
+def render_composite(panels, columns = None, max_workers = None):
+    # Returns (image, layout). layout: [{"title", "box": (left, top, right, bottom)}] of each panel.
+    # columns: number of panels in a grid row (None: all panels in one row)
+    if len(panels) == 0:
+        raise ValueError("No panels to render.")
+    if columns == None or columns <= 0:
+        columns = len(panels)
+    images = render_panels(panels, columns, max_workers)
+
+    titles = ["{}".format(x.get("title") or "") for x in panels]
+    title_widths = [right - left for left, _, right, _ in (glyph_cache.get_bbox(title_font_size, x) for x in titles)]
+
+    n_rows = -(-len(images) // columns)
+    # A column is wide enough for the panels and their titles.
+    column_widths = [max(max(x.width for x in images[i::columns]), max(title_widths[i::columns]) + title_margin) for i in range(columns)]
+    title_height = calc_title_height()
+    row_heights = [title_height + max(x.height for x in images[i * columns:(i + 1) * columns]) for i in range(n_rows)]
+
+    canvas = Image.new('L', (sum(column_widths), sum(row_heights)), color = 255)
+    layout = []
+    for i_panel, (panel, img) in enumerate(zip(panels, images)):
+        i_row, i_column = divmod(i_panel, columns)
+        left = sum(column_widths[:i_column])
+        top = sum(row_heights[:i_row]) + title_height
+        canvas.paste(img, (left, top))
+
+        # Title centered above the field, within the column
+        settings = make_panel_settings(panel["render_settings"], i_column == 0)
+        field_center = left + (settings["offset_left"] + img.width - settings["offset_right"]) / 2
+        title_left = min(max(left, field_center - title_widths[i_panel] / 2), left + column_widths[i_column] - title_widths[i_panel] - title_margin)
+        glyph_cache.draw_text(canvas, (title_left, top - title_height + title_margin // 2), titles[i_panel], 0, title_font_size)
+        layout.append({"title": titles[i_panel], "box": (left, top, left + img.width, top + img.height)})
+    return canvas, layout
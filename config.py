@@ -0,0 +1,80 @@
+import os
+import tempfile
+import importlib.util
+
+############################################################
+#  Server Settings (set by environment variables)
+############################################################
+# Directory shared among gunicorn workers. If it is not set, each worker keeps the data in its own memory.
+cache_dir = os.getenv("TPN_CALCULATOR_CACHE_DIR")
+
+# Upper bound of the uploaded datasets kept in memory (and on disk) per process.
+dataset_cache_mb = int(os.getenv("TPN_CALCULATOR_DATASET_CACHE_MB", "512"))
+
+# Hours after their last use when the uploaded data, the data derived from them and the rendered images are
+# deleted from the server (memory and cache directory). 0: kept until evicted by the size limits.
+data_ttl_hours = float(os.getenv("TPN_CALCULATOR_DATA_TTL_HOURS", "24"))
+data_ttl = data_ttl_hours * 3600 if 0 < data_ttl_hours else None
+
+# Number of rows shown in a page of the data tables.
+table_page_size = int(os.getenv("TPN_CALCULATOR_TABLE_PAGE_SIZE", "100"))
+
+# Upper bound of the rendered images kept in memory (and on disk) per process.
+render_cache_mb = int(os.getenv("TPN_CALCULATOR_RENDER_CACHE_MB", "128"))
+
+# Generate and Calculate run as background jobs (Dash background callbacks with a local diskcache) if "1"
+# and the optional packages are installed (pip install "dash[diskcache]"). Otherwise they run in the request.
+background_callbacks = os.getenv("TPN_CALCULATOR_BACKGROUND", "1") == "1" and \
+    all(importlib.util.find_spec(x) != None for x in ("diskcache", "multiprocess", "psutil"))
+
+# Max number of background jobs running at the same time (shared among workers).
+background_workers = int(os.getenv("TPN_CALCULATOR_BACKGROUND_WORKERS", "2"))
+
+# If "1", rendered images are also kept on disk and shared among workers.
+# Background jobs run in their own processes, so the datasets and the images are always shared through the disk.
+shared_render_cache = os.getenv("TPN_CALCULATOR_SHARED_RENDER_CACHE", "0") == "1" or background_callbacks
+render_cache_dir = cache_dir if cache_dir != None else os.path.join(tempfile.gettempdir(), "tpn-calculator")
+dataset_cache_dir = cache_dir if cache_dir != None or background_callbacks == False else render_cache_dir
+background_cache_dir = os.path.join(render_cache_dir, "jobs")
+
+# dtype of the signal values of the uploaded data. "float32" halves the memory of large data,
+# but rounds the values to about 7 significant digits.
+signal_dtype = os.getenv("TPN_CALCULATOR_SIGNAL_DTYPE", "float64")
+
+# How the uploaded (and normalized) data are kept: "server" keeps them on the server and sends only a reference
+# to the browser; "columnar" also sends the values to the browser's dcc.Store as compact base64 blocks, so that
+# any worker (or background job) can decode them without a shared cache directory.
+dataset_transport = os.getenv("TPN_CALCULATOR_DATASET_TRANSPORT", "server")
+
+# If "1", the parse time and the peak memory of each upload are printed on the server console.
+report_upload_memory = os.getenv("TPN_CALCULATOR_REPORT_UPLOAD_MEMORY", "0") == "1"
+
+# If "1", the peak memory allocated while drawing is traced (tracemalloc, which slows down the rendering)
+# and appended to the log with the render time. Otherwise only the time is measured.
+report_render_memory = os.getenv("TPN_CALCULATOR_REPORT_RENDER_MEMORY", "0") == "1"
+
+# Max height (px) of the band field in the preview image. Taller data are resampled for the preview,
+# and the full resolution image is rendered on download. 0: always full resolution.
+preview_field_height = int(os.getenv("TPN_CALCULATOR_PREVIEW_HEIGHT", "1000"))
+
+# Max number of points per series sent to the line plots. Zooming in re-fetches the points of the visible range.
+graph_point_budget = int(os.getenv("TPN_CALCULATOR_GRAPH_POINTS", "2000"))
+
+# Upper bound of the memoized (decimated) trace arrays of the line plots per process.
+graph_cache_mb = int(os.getenv("TPN_CALCULATOR_GRAPH_CACHE_MB", "64"))
+
+# Encoding of the images: PNG compression level 0-9 (lower is faster, but the files are larger),
+# the format of the preview in the page ("png" or "webp", lossless) and of the downloaded image
+# ("png" or "tiff", deflate compressed for publication).
+png_compress_level = int(os.getenv("TPN_CALCULATOR_PNG_LEVEL", "6"))
+preview_format = os.getenv("TPN_CALCULATOR_PREVIEW_FORMAT", "png")
+download_format = os.getenv("TPN_CALCULATOR_DOWNLOAD_FORMAT", "png")
+
+# If "1", the time of each stage of Generate (data, draw, encode, base64) is appended to the log.
+# The callback timings and payload sizes are always available at /metrics (Prometheus text format).
+log_timings = os.getenv("TPN_CALCULATOR_LOG_TIMINGS", "0") == "1"
+
+# When the lazily imported libraries (pandas, NumPy, Pillow fonts, openpyxl, plotly figures) are loaded
+# ahead of the first request with gunicorn.conf.py: "preload" (in the master before forking, shared copy-on-write
+# by the workers), "background" (a thread in each worker after it starts, each worker imports them itself) or "off".
+warmup = os.getenv("TPN_CALCULATOR_WARMUP", "preload")
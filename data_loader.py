@@ -0,0 +1,111 @@
+import os
+import numpy as np
+import pandas as pd
+
+import config
+import utilfuncs
+
+############################################################
+#  Read Simple Western data (independent of Dash)
+############################################################
+data_file_extensions = ('.csv', '.txt', '.tsv', '.xlsx', '.xls')
+mw_column_name = 'kDa'
+
+# Only the beginning of the file is decoded to find the delimiter and the header.
+sniff_size = 64 * 1024
+
+def sniff_header(first_bytes: bytes, filename: str):
+    # Returns (delimiter, column names) from the first line of a CSV/TSV file.
+    default_delimiter = ',' if filename.endswith('.csv') else '\t'
+    other_delimiter = '\t' if default_delimiter == ',' else ','
+    text = bytes(first_bytes).decode('utf-8-sig', errors = 'replace')
+    header_line = text.splitlines()[0] if 0 < len(text) else ""
+    delimiter = default_delimiter
+    if default_delimiter not in header_line and other_delimiter in header_line:
+        delimiter = other_delimiter
+    # Leading spaces are skipped as in read_csv(skipinitialspace = True).
+    column_names = [x.lstrip(' ') for x in header_line.split(delimiter)]
+    column_names = [x[1:-1] if 2 <= len(x) and x[0] == x[-1] == '"' else x for x in column_names]
+    return delimiter, column_names
+
+def read_first_bytes(file) -> bytes:
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, 'rb') as f:
+            return f.read(sniff_size)
+    position = file.tell()
+    first_bytes = file.read(sniff_size)
+    file.seek(position)
+    return first_bytes
+
+def make_dtypes(column_names, signal_dtype):
+    # The molecular weights are always kept in float64, the signals in signal_dtype.
+    return {x: (np.float64 if x == mw_column_name else signal_dtype) for x in column_names}
+
+def replace_blank_strings(df: pd.DataFrame) -> pd.DataFrame:
+    # Whitespace-only strings -> NaN, then the columns are converted to numbers where possible.
+    object_columns = df.select_dtypes(include = object).columns
+    for x in object_columns:
+        column = df[x]
+        try:
+            column = column.mask(column.str.strip().eq(''), np.nan)
+        except AttributeError:
+            # No strings in the column
+            pass
+        try:
+            column = pd.to_numeric(column)
+        except (ValueError, TypeError):
+            pass
+        df[x] = column
+    return df
+
+def read_text_data(file, filename: str, signal_dtype) -> pd.DataFrame:
+    delimiter, column_names = sniff_header(read_first_bytes(file), filename)
+    if len(column_names) == 0 or column_names[0] != mw_column_name:
+        # Not a valid data file. The header is enough for the caller to tell the reason.
+        return pd.DataFrame(columns = column_names)
+
+    # Blank cells (empty or whitespace only) are read as NaN: skipinitialspace makes the parser skip the spaces.
+    position = None if isinstance(file, (str, os.PathLike)) else file.tell()
+    try:
+        return pd.read_csv(file, delimiter = delimiter, encoding = 'utf-8', skipinitialspace = True,
+                           dtype = make_dtypes(column_names, signal_dtype))
+    except ValueError:
+        # Non-numeric cells. Read as is.
+        if position != None:
+            file.seek(position)
+        return replace_blank_strings(pd.read_csv(file, delimiter = delimiter, encoding = 'utf-8', skipinitialspace = True))
+
+def read_excel_data(file, signal_dtype) -> pd.DataFrame:
+    df = replace_blank_strings(pd.read_excel(file))
+    try:
+        df = df.astype(make_dtypes(df.columns, signal_dtype))
+    except ValueError:
+        pass
+    return df
+
+def read_data(file, filename: str, signal_dtype = None, stats: dict | None = None) -> pd.DataFrame | None:
+    # file is a path or a binary buffer (io.BytesIO). filename is used to determine the format.
+    # If stats (dict) is given, the parse time and the peak memory allocated while parsing are stored in it.
+    if signal_dtype == None:
+        signal_dtype = config.signal_dtype
+    with utilfuncs.measure(stats, "parse_time"):
+        try:
+            if filename.endswith(('.csv', '.txt', '.tsv')):
+                df = read_text_data(file, filename, signal_dtype)
+            elif filename.endswith(('.xlsx', '.xls')):
+                df = read_excel_data(file, signal_dtype)
+            else:
+                df = None
+        except:
+            df = None
+    if stats != None and df is not None:
+        stats["data_memory"] = int(df.memory_usage(deep = True).sum())
+    return df
+
+def fill_blank_cells(df: pd.DataFrame):
+    # Returns the data with the blank cells (NaN after read_data()) replaced by 0 and the names of series which contained blank cells.
+    contains_blank = df.isna().any()
+    blank_contain_series = set(contains_blank.index[contains_blank])
+    if 0 < len(blank_contain_series):
+        df = df.fillna({x: 0 for x in blank_contain_series})
+    return df, blank_contain_series
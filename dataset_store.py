@@ -0,0 +1,287 @@
+import os
+import re
+import json
+import struct
+import base64
+import hashlib
+import numpy as np
+import pandas as pd
+
+import config
+import normalization
+from cache_store import MemoryStore, DiskStore, make_private_dir
+
+############################################################
+#  Server-side store of the uploaded (and normalized) data
+############################################################
+def calc_dataset_id(df: pd.DataFrame) -> str:
+    # Content hash, so that the same data always gets the same ID.
+    hasher = hashlib.sha256()
+    hasher.update("\t".join(str(x) for x in df.columns).encode('utf-8'))
+    hasher.update(pd.util.hash_pandas_object(df, index = False).to_numpy().tobytes())
+    return hasher.hexdigest()
+
+# The datasets are written to disk without pickle, so that reading a file never runs code:
+#   4 bytes: length of the header (little endian), header (JSON), then the values of the numeric columns
+# header: {"n_rows": int, "columns": [{"name": name, "dtype": "<f8"} or {"name": name, "values": [...]}]}
+# The numeric columns are stored as raw little-endian arrays in the column order, the others as JSON values.
+def serialize_dataframe(df: pd.DataFrame) -> bytes:
+    columns = []
+    buffers = []
+    for name in df.columns:
+        series = df[name]
+        if isinstance(series.dtype, np.dtype) and series.dtype.kind in "biufcmM":
+            little_endian = series.dtype.newbyteorder('<')
+            buffers.append(np.ascontiguousarray(series.to_numpy(dtype = little_endian)).tobytes())
+            columns.append({"name": name, "dtype": little_endian.str})
+        else:
+            columns.append({"name": name, "values": series.astype(object).where(series.notna(), None).tolist()})
+    header = json.dumps({"n_rows": len(df), "columns": columns}, default = str).encode('utf-8')
+    return b"".join([struct.pack("<I", len(header)), header] + buffers)
+
+def deserialize_dataframe(serialized: bytes) -> pd.DataFrame:
+    header_length = struct.unpack_from("<I", serialized)[0]
+    header = json.loads(serialized[4:4 + header_length])
+    n_rows = header["n_rows"]
+    buffer = memoryview(serialized)[4 + header_length:]
+    offset = 0
+    columns = {}
+    for column in header["columns"]:
+        if "dtype" in column:
+            dtype = np.dtype(column["dtype"])
+            columns[column["name"]] = np.frombuffer(buffer, dtype = dtype, count = n_rows, offset = offset)
+            offset += dtype.itemsize * n_rows
+        else:
+            columns[column["name"]] = pd.Series(column["values"], dtype = object)
+    return pd.DataFrame(columns, columns = [x["name"] for x in header["columns"]])
+
+class DatasetStore:
+    def __init__(self, max_bytes: int, cache_dir: str | None = None, max_age: float | None = None):
+        self.memory = MemoryStore(max_bytes, sizeof = lambda df: int(df.memory_usage(deep = True).sum()), max_age = max_age)
+        self.disk = None
+        if cache_dir != None:
+            self.disk = DiskStore(os.path.join(make_private_dir(cache_dir), "datasets"), max_bytes, max_age)
+
+    def put(self, df: pd.DataFrame, dataset_id: str | None = None) -> str:
+        if dataset_id == None:
+            dataset_id = calc_dataset_id(df)
+        self.memory.put(dataset_id, df)
+        if self.disk != None and dataset_id not in self.disk:
+            self.disk.put(dataset_id, serialize_dataframe(df))
+        return dataset_id
+
+    def get(self, dataset_id: str) -> pd.DataFrame | None:
+        df = self.memory.get(dataset_id)
+        if df is None and self.disk != None:
+            # Possibly stored by another worker.
+            serialized = self.disk.get(dataset_id)
+            if serialized != None:
+                try:
+                    df = deserialize_dataframe(serialized)
+                except (ValueError, KeyError, struct.error):
+                    # Not a dataset file (e.g. written by an older version): treated as missing.
+                    return None
+                self.memory.put(dataset_id, df)
+        return df
+
+store = DatasetStore(config.dataset_cache_mb * 1024 * 1024, config.dataset_cache_dir, config.data_ttl)
+
+# Prefix-sum indexes for the signal sums, built on first use for each dataset.
+signal_sum_indexes = MemoryStore(config.dataset_cache_mb * 1024 * 1024, sizeof = lambda x: x.nbytes, max_age = config.data_ttl)
+
+# Row orders of the filtered and sorted tables, so that paging does not filter and sort again.
+table_row_orders = MemoryStore(config.dataset_cache_mb * 1024 * 1024 // 8, sizeof = lambda x: x.nbytes, max_age = config.data_ttl)
+
+
+############################################################
+#  Columnar transport (config.dataset_transport == "columnar")
+############################################################
+# The values are sent to the browser as base64 blocks instead of JSON records.
+# Each block is a run of adjacent columns of the same dtype, stored column by column (little endian):
+#   {"dtype": "<f4", "n_columns": 12, "data": base64 of n_columns * n_rows values}
+# The decoded blocks are used as the DataFrame values without copying.
+def encode_columnar(df: pd.DataFrame):
+    # Returns the list of blocks, or None if a column is not numeric.
+    if not all(pd.api.types.is_numeric_dtype(x) and not pd.api.types.is_bool_dtype(x) for x in df.dtypes):
+        return None
+    blocks = []
+    start = 0
+    while start < len(df.columns):
+        dtype = df.dtypes.iloc[start]
+        end = start + 1
+        while end < len(df.columns) and df.dtypes.iloc[end] == dtype:
+            end += 1
+        little_endian = np.dtype(dtype).newbyteorder('<')
+        values = np.ascontiguousarray(df.iloc[:, start:end].to_numpy(dtype = little_endian).T)
+        blocks.append({"dtype": little_endian.str, "n_columns": end - start, "data": base64.b64encode(values).decode('ascii')})
+        start = end
+    return blocks
+
+def decode_columnar(blocks, columns, n_rows: int) -> pd.DataFrame:
+    frames = []
+    start = 0
+    for block in blocks:
+        n_columns = block["n_columns"]
+        values = np.frombuffer(base64.b64decode(block["data"]), dtype = block["dtype"]).reshape(n_columns, n_rows)
+        # values.T is in the column-major layout of the pandas block, so it is not copied.
+        frames.append(pd.DataFrame(values.T, columns = columns[start:start + n_columns], copy = False))
+        start += n_columns
+    if len(frames) == 1:
+        return frames[0]
+    return pd.concat(frames, axis = 1, copy = False)
+
+
+############################################################
+#  Helpers for the dcc.Store holding the dataset reference
+############################################################
+def make_dataset_info(df: pd.DataFrame):
+    if config.dataset_transport == "columnar":
+        blocks = encode_columnar(df)
+        if blocks != None:
+            # The data travel with the reference. The server keeps them only in memory, as a cache of the decoded blocks.
+            dataset_id = calc_dataset_id(df)
+            store.memory.put(dataset_id, df)
+            return {"dataset_id": dataset_id, "n_rows": len(df), "columns": list(df.columns), "blocks": blocks}
+    dataset_id = store.put(df)
+    return {"dataset_id": dataset_id, "n_rows": len(df), "columns": list(df.columns)}
+
+def make_dataset_reference(dataset_info, df: pd.DataFrame | None = None):
+    # The dataset info without the columnar blocks, e.g. for a dcc.Store which is sent back by other callbacks.
+    # The data (df) are then kept in the store, as the reference alone does not carry them.
+    # Without the disk store, the other workers could not resolve the reference: the blocks are kept.
+    if "blocks" not in dataset_info or store.disk == None:
+        return dataset_info
+    if df is not None:
+        store.put(df, dataset_info["dataset_id"])
+    return {key: value for key, value in dataset_info.items() if key != "blocks"}
+
+def get_dataframe(dataset_info) -> pd.DataFrame | None:
+    if not isinstance(dataset_info, dict) or "dataset_id" not in dataset_info:
+        return None
+    df = store.get(dataset_info["dataset_id"])
+    if df is None and "blocks" in dataset_info:
+        df = decode_columnar(dataset_info["blocks"], dataset_info["columns"], dataset_info["n_rows"])
+        store.memory.put(dataset_info["dataset_id"], df)
+    return df
+
+############################################################
+#  Filtering and sorting of the data tables (custom paging)
+############################################################
+# filter_query is written by the filter row of the DataTable: "{kDa} s> 20 && {S1} s<= 1000".
+# Only the conditions joined by "&&" (or "and") are supported. A query with an unknown column or an unsupported
+# condition is invalid and shows no rows, as the native filtering of the DataTable does.
+filter_part_pattern = re.compile(r'^\{(?P<column>[^}]*)\}\s*(?P<operator>[is]?(?:contains|>=|<=|!=|=|>|<|eq|ne|ge|le|gt|lt)(?=\s|$))\s*'
+                                 r'''(?P<value>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*'|`(?:[^`\\]|\\.)*`|[^\s"'`]+)$''', re.IGNORECASE)
+operator_names = {"=": "eq", "!=": "ne", ">=": "ge", "<=": "le", ">": "gt", "<": "lt"}
+
+def parse_filter_query(filter_query):
+    # Returns the list of (column, operator, value, ignore_case). operator: contains, eq, ne, ge, le, gt or lt
+    # Raises ValueError if a part of the query is not supported.
+    conditions = []
+    if not filter_query:
+        return conditions
+    for part in re.split(r'\s+(?:&&|and)\s+(?=\{)', filter_query.strip(), flags = re.IGNORECASE):
+        match = filter_part_pattern.match(part.strip())
+        if match == None:
+            raise ValueError("Invalid filter: {}".format(part.strip()))
+        operator = match.group("operator").lower()
+        # "i" / "s" prefix: case insensitive / sensitive
+        ignore_case = operator[0] == "i"
+        if operator[0] in "is":
+            operator = operator[1:]
+        operator = operator_names.get(operator, operator)
+        value = match.group("value").strip()
+        if 2 <= len(value) and value[0] == value[-1] and value[0] in "'\"`":
+            value = value[1:-1].replace("\\" + value[0], value[0])
+        conditions.append((match.group("column"), operator, value, ignore_case))
+    return conditions
+
+def filter_mask(series: pd.Series, operator, value, ignore_case = False) -> np.ndarray:
+    if operator == "contains":
+        return series.astype(str).str.contains(value, case = not ignore_case, regex = False).to_numpy()
+    try:
+        number = float(value)
+    except ValueError:
+        # A numeric column never matches a text.
+        return np.full(len(series), operator == "ne")
+    values = series.to_numpy()
+    comparisons = {"eq": np.equal, "ne": np.not_equal, "ge": np.greater_equal, "le": np.less_equal, "gt": np.greater, "lt": np.less}
+    return comparisons[operator](values, number)
+
+def calc_row_order(df: pd.DataFrame, sort_by, filter_query) -> np.ndarray | None:
+    # Returns the positions of the shown rows in order, or None if all rows are shown as they are.
+    rows = None
+    try:
+        conditions = parse_filter_query(filter_query)
+    except ValueError:
+        return np.zeros(0, dtype = np.intp)
+    for column, operator, value, ignore_case in conditions:
+        if column not in df.columns:
+            return np.zeros(0, dtype = np.intp)
+        mask = filter_mask(df[column], operator, value, ignore_case)
+        rows = np.flatnonzero(mask) if rows is None else rows[mask[rows]]
+
+    sort_by = [x for x in (sort_by or []) if x.get("column_id") in df.columns]
+    if 0 < len(sort_by):
+        keys = df[[x["column_id"] for x in sort_by]]
+        if rows is not None:
+            keys = keys.iloc[rows]
+        # Stable sort: rows with equal values keep the order of the data.
+        order = keys.reset_index(drop = True).sort_values([x["column_id"] for x in sort_by], ascending = [x["direction"] == "asc" for x in sort_by],
+                                                          kind = "stable", na_position = "last").index.to_numpy()
+        rows = order if rows is None else rows[order]
+    return rows
+
+def get_row_order(dataset_info, df: pd.DataFrame, sort_by, filter_query) -> np.ndarray | None:
+    if not sort_by and not filter_query:
+        return None
+    key = "{}:{}:{}".format(dataset_info["dataset_id"], json.dumps(sort_by, sort_keys = True), filter_query)
+    rows = table_row_orders.get(key)
+    if rows is None:
+        rows = calc_row_order(df, sort_by, filter_query)
+        if rows is None:
+            return None
+        table_row_orders.put(key, rows)
+    return rows
+
+def get_page(dataset_info, page_current: int, page_size: int, sort_by = None, filter_query = None):
+    # Returns (records of the page, number of the shown rows), or (None, 0) if the data are not available.
+    df = get_dataframe(dataset_info)
+    if df is None:
+        return None, 0
+    rows = get_row_order(dataset_info, df, sort_by, filter_query)
+    start = page_current * page_size
+    if rows is None:
+        page = df.iloc[start:start + page_size]
+        n_rows = len(df)
+    else:
+        page = df.iloc[rows[start:start + page_size]]
+        n_rows = len(rows)
+    # float32 values are converted through their shortest representation (e.g. 103.6547, not 103.65470123291016).
+    float32_columns = page.select_dtypes(include = np.float32).columns
+    if 0 < len(float32_columns):
+        page = page.astype({x: str for x in float32_columns}).astype({x: np.float64 for x in float32_columns})
+    return page.to_dict('records'), n_rows
+
+def get_table_dataframe(dataset_info, sort_by = None, filter_query = None) -> pd.DataFrame | None:
+    # The whole table as shown (filtered and sorted), e.g. for the export.
+    df = get_dataframe(dataset_info)
+    if df is None:
+        return None
+    rows = get_row_order(dataset_info, df, sort_by, filter_query)
+    return df if rows is None else df.iloc[rows]
+
+def calc_page_count(n_rows: int, page_size: int) -> int:
+    return max(1, -(-n_rows // page_size))
+
+def get_signal_sum_index(dataset_info) -> normalization.SignalSumIndex | None:
+    if not isinstance(dataset_info, dict) or "dataset_id" not in dataset_info:
+        return None
+    signal_sum_index = signal_sum_indexes.get(dataset_info["dataset_id"])
+    if signal_sum_index == None:
+        df = get_dataframe(dataset_info)
+        if df is None:
+            return None
+        signal_sum_index = normalization.SignalSumIndex(df)
+        signal_sum_indexes.put(dataset_info["dataset_id"], signal_sum_index)
+    return signal_sum_index
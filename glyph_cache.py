@@ -0,0 +1,78 @@
+import math
+import functools
+from PIL import Image, ImageDraw, ImageFont
+
+import config
+from cache_store import MemoryStore
+
+############################################################
+#  Font and glyph cache for the labels of the band image
+############################################################
+# The labels are drawn by pasting cached bitmaps, which gives the same pixels as ImageDraw.text():
+# the text is rasterized once per (size, text, sub-pixel position) and blended with the same mask.
+glyph_cache_bytes = 16 * 1024 * 1024
+
+# The texts are the labels of the lanes (e.g. the sample names), so they expire with the data.
+# (font size, text, fraction of x, fraction of y) -> (mask, offset)
+glyphs = MemoryStore(glyph_cache_bytes, sizeof = lambda x: x[0].width * x[0].height + 64, max_age = config.data_ttl)
+# (font size, text, margin) -> RGBA image of the label rotated by 90 degrees
+rotated_labels = MemoryStore(glyph_cache_bytes, sizeof = lambda x: 4 * x.width * x.height + 64, max_age = config.data_ttl)
+
+@functools.lru_cache(maxsize = 32)
+def get_font(font_size):
+    return ImageFont.load_default(font_size)    # For now, use default font.
+
+@functools.lru_cache(maxsize = 32)
+def get_metrics(font_size):
+    # (ascent, descent)
+    return get_font(font_size).getmetrics()
+
+@functools.lru_cache(maxsize = 4096)
+def get_bbox(font_size, text):
+    return get_font(font_size).getbbox(text)
+
+def get_glyph(font_size, text, fraction):
+    key = (font_size, text, fraction)
+    glyph = glyphs.get(key)
+    if glyph == None:
+        font = get_font(font_size)
+        mask_core, offset = font.getmask2(text, 'L', start = fraction)
+        width, height = mask_core.size
+        # Draw the text with the same sub-pixel position on a blank canvas; ink 255 on 0 leaves the mask itself.
+        margin = max(0, -offset[0], -offset[1])
+        canvas = Image.new('L', (margin + max(0, offset[0]) + width + 1, margin + max(0, offset[1]) + height + 1), color = 0)
+        ImageDraw.Draw(canvas).text((margin + fraction[0], margin + fraction[1]), text, 255, font = font)
+        mask = canvas.crop((margin + offset[0], margin + offset[1], margin + offset[0] + width, margin + offset[1] + height))
+        glyph = (mask, offset)
+        glyphs.put(key, glyph)
+    return glyph
+
+def draw_text(im, xy, text, fill, font_size):
+    # Same as ImageDraw.Draw(im).text(xy, text, fill, font = get_font(font_size)) for 'L' images.
+    x, y = xy
+    if x < 0 or y < 0:
+        ImageDraw.Draw(im).text(xy, text, fill, font = get_font(font_size))
+        return
+    mask, offset = get_glyph(font_size, text, (math.modf(x)[0], math.modf(y)[0]))
+    if mask.width == 0 or mask.height == 0:
+        return
+    left = int(x) + offset[0]
+    top = int(y) + offset[1]
+    im.paste(fill, (left, top, left + mask.width, top + mask.height), mask)
+
+def get_rotated_label(font_size, text, margin):
+    # Label drawn in black on a transparent image with `margin` px around, rotated by 90 degrees.
+    key = (font_size, text, margin)
+    text_image = rotated_labels.get(key)
+    if text_image == None:
+        ascent, descent = get_metrics(font_size)
+        left, top, right, bottom = get_bbox(font_size, text)
+        text_width = right - left
+        text_height = bottom - top
+        w_, h_ = text_width + margin, ascent + descent + margin
+        text_image = Image.new('RGBA', (w_, h_), (0,0,0,0))
+        text_draw = ImageDraw.Draw(text_image)
+        text_draw.text((margin//2, ascent - text_height), text, font = get_font(font_size), fill = (0,0,0,255))
+        text_image = text_image.rotate(90, expand = True)
+        rotated_labels.put(key, text_image)
+    return text_image
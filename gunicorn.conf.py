@@ -0,0 +1,52 @@
+import os
+import multiprocessing
+
+############################################################
+#  Production profile (gunicorn -c gunicorn.conf.py app:server)
+############################################################
+# The app (Dash, the layout and the callbacks) and, with TPN_CALCULATOR_WARMUP=preload (default), the lazily
+# imported libraries (pandas, plotly, ...) are imported once in the master and the workers are forked from it,
+# so the imported modules are shared (copy-on-write) and the workers start fast.
+# The workers keep the data in their own memory, so the datasets and the rendered images are shared
+# through a cache directory on disk. The background jobs are limited by TPN_CALCULATOR_BACKGROUND_WORKERS.
+#
+# Environment variables:
+#   PORT                      port to listen on (default: 8000)
+#   GUNICORN_WORKERS          number of worker processes (default: 2 * CPUs + 1, max 9)
+#   GUNICORN_TIMEOUT          seconds before a silent worker is restarted (default: 120)
+#   TPN_CALCULATOR_CACHE_DIR  shared cache directory (default: /tmp/tpn-calculator)
+#   TPN_CALCULATOR_WARMUP     preload (default), background or off (see config.py)
+
+# Set before the app is imported (config.py reads them at import).
+os.environ.setdefault("TPN_CALCULATOR_CACHE_DIR", "/tmp/tpn-calculator")
+os.environ.setdefault("TPN_CALCULATOR_SHARED_RENDER_CACHE", "1")
+
+bind = "0.0.0.0:{}".format(os.getenv("PORT", "8000"))
+preload_app = True
+
+# Sync workers (one thread each): the background jobs are forked from the worker, and a fork while another
+# thread holds a lock (e.g. of the SQLite job cache) leaves the job blocked forever. The heavy work runs in
+# the background jobs, so the workers mostly serve light requests (table pages, progress polling).
+workers = int(os.getenv("GUNICORN_WORKERS", str(min(2 * multiprocessing.cpu_count() + 1, 9))))
+worker_class = "sync"
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = 30
+
+# No max_requests: a worker restarted by it waits for its running background jobs (child processes)
+# and is killed at the timeout, dropping the requests in flight.
+
+accesslog = "-"
+errorlog = "-"
+
+# Warmup of the lazily imported libraries (TPN_CALCULATOR_WARMUP, see warmup.py)
+def when_ready(server):
+    import config
+    import warmup
+    if config.warmup == "preload":
+        warmup.warmup()
+
+def post_worker_init(worker):
+    import config
+    import warmup
+    if config.warmup == "background":
+        warmup.start()
@@ -0,0 +1,206 @@
+import os
+import time
+import threading
+import functools
+import contextlib
+import flask
+from dash.exceptions import PreventUpdate
+
+import config
+import background
+import warmup
+
+############################################################
+#  Callback metrics (Prometheus text format at /metrics)
+############################################################
+# tpn_callback_duration_seconds{callback}            wall time of the callback function
+# tpn_callback_errors_total{callback}                exceptions other than PreventUpdate
+# tpn_callback_http_duration_seconds{callback}       whole request (incl. JSON decoding/encoding)
+# tpn_callback_request_bytes{callback}               payload sent by the browser (inputs and states)
+# tpn_callback_response_bytes{callback}              payload sent back (outputs)
+# tpn_stage_duration_seconds{callback, stage}        stages inside a callback (see stage())
+# tpn_render_cache_lookups_total{result}             render cache lookups: "memory" / "disk" (hits) or "miss"
+#
+# The summaries are kept as (count, sum). With background callbacks, the jobs run in their own processes,
+# so the metrics are kept in the shared job cache (all workers and jobs report to the same counters).
+# Otherwise each process keeps its own.
+metric_types = {
+    "tpn_callback_duration_seconds": "summary",
+    "tpn_callback_errors_total": "counter",
+    "tpn_callback_http_duration_seconds": "summary",
+    "tpn_callback_request_bytes": "summary",
+    "tpn_callback_response_bytes": "summary",
+    "tpn_stage_duration_seconds": "summary",
+    "tpn_render_cache_lookups_total": "counter",
+}
+metrics_key = "metrics"
+
+class MetricStore:
+    def __init__(self, shared_cache = None):
+        self.shared_cache = shared_cache
+        self._values = {}   # (name, labels) -> [count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, observations):
+        # observations: list of (name, labels (tuple of (key, value)), value)
+        if self.shared_cache != None:
+            with self.shared_cache.transact():
+                values = self.shared_cache.get(metrics_key, {})
+                self._add(values, observations)
+                self.shared_cache.set(metrics_key, values)
+            return
+        with self._lock:
+            self._add(self._values, observations)
+
+    def _add(self, values, observations):
+        for name, labels, value in observations:
+            count_sum = values.setdefault((name, labels), [0, 0])
+            count_sum[0] += 1
+            count_sum[1] += value
+
+    def snapshot(self):
+        if self.shared_cache != None:
+            return dict(self.shared_cache.get(metrics_key, {}))
+        with self._lock:
+            return {key: list(x) for key, x in self._values.items()}
+
+    def render(self) -> str:
+        # Prometheus text exposition format
+        values = self.snapshot()
+        lines = []
+        for name, metric_type in metric_types.items():
+            lines.append("# TYPE {} {}".format(name, metric_type))
+            for (name_, labels), (count, total) in sorted(values.items()):
+                if name_ != name:
+                    continue
+                label_text = ",".join('{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"')) for key, value in labels)
+                if metric_type == "counter":
+                    lines.append("{}{{{}}} {}".format(name, label_text, count))
+                else:
+                    lines.append("{}_count{{{}}} {}".format(name, label_text, count))
+                    lines.append("{}_sum{{{}}} {}".format(name, label_text, total))
+        return "\n".join(lines) + "\n"
+
+metric_store = MetricStore(background.job_cache)
+
+#----------------------------------------
+# Stages inside a callback
+#----------------------------------------
+@contextlib.contextmanager
+def stage(callback_name, stage_name, timings: dict | None = None):
+    # Records the time of the block. If timings (dict) is given, the time is also stored in it (for the log).
+    time_start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - time_start
+        metric_store.observe([("tpn_stage_duration_seconds", (("callback", callback_name), ("stage", stage_name)), elapsed)])
+        if timings != None:
+            timings[stage_name] = timings.get(stage_name, 0) + elapsed
+
+def describe_timings(timings) -> str:
+    log_text = "Timings\n"
+    for stage_name, elapsed in timings.items():
+        log_text += "{}:\t {:.3f} s\n".format(stage_name, elapsed)
+    return log_text
+
+#----------------------------------------
+# Callbacks
+#----------------------------------------
+# Output id of the callback (as sent by the browser) -> name of the function
+callback_names = {}
+
+def timed(func):
+    name = func.__name__
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        time_start = time.perf_counter()
+        observations = []
+        try:
+            return func(*args, **kwargs)
+        except PreventUpdate:
+            raise
+        except Exception:
+            observations.append(("tpn_callback_errors_total", (("callback", name),), 1))
+            raise
+        finally:
+            observations.append(("tpn_callback_duration_seconds", (("callback", name),), time.perf_counter() - time_start))
+            metric_store.observe(observations)
+    return wrapper
+
+class InstrumentedApp:
+    # Same as the Dash app, but the functions registered by callback() are timed.
+    def __init__(self, app):
+        self._app = app
+
+    def callback(self, *args, **kwargs):
+        # The callback is added to callback_map by callback(), before the function is given.
+        keys_before = set(self._app.callback_map)
+        register = self._app.callback(*args, **kwargs)
+        new_keys = set(self._app.callback_map) - keys_before
+        def decorator(func):
+            for key in new_keys:
+                callback_names[key] = func.__name__
+            return register(timed(func))
+        return decorator
+
+    def __getattr__(self, name):
+        return getattr(self._app, name)
+
+def instrument(app):
+    return InstrumentedApp(app)
+
+#----------------------------------------
+# HTTP (payload sizes) and the endpoint
+#----------------------------------------
+def init_server(server: flask.Flask, path = "/metrics"):
+    @server.before_request
+    def start_timer():
+        flask.g.metrics_time_start = time.perf_counter()
+
+    @server.after_request
+    def record_request(response):
+        if not flask.request.path.endswith("_dash-update-component") or "metrics_time_start" not in flask.g:
+            return response
+        body = flask.request.get_json(silent = True)
+        output = body.get("output") if isinstance(body, dict) else None
+        labels = (("callback", callback_names.get(output, "unknown")),)
+        response_bytes = 0 if response.is_streamed else len(response.get_data())
+        metric_store.observe([
+            ("tpn_callback_http_duration_seconds", labels, time.perf_counter() - flask.g.metrics_time_start),
+            ("tpn_callback_request_bytes", labels, flask.request.content_length or 0),
+            ("tpn_callback_response_bytes", labels, response_bytes),
+        ])
+        return response
+
+    @server.route(path)
+    def metrics():
+        return flask.Response(metric_store.render(), mimetype = "text/plain; version=0.0.4")
+
+#----------------------------------------
+# Readiness (for load balancers and container health checks)
+#----------------------------------------
+def check_health():
+    # Returns {check name: "ok" or the error}. The worker is ready when all checks are "ok".
+    checks = {"warmup": "ok" if warmup.done.is_set() else "warming up"}
+    directories = {"dataset_cache": config.dataset_cache_dir}
+    if config.shared_render_cache == True:
+        directories["render_cache"] = config.render_cache_dir
+    for name, directory in directories.items():
+        if directory == None:
+            continue
+        checks[name] = "ok" if os.path.isdir(directory) and os.access(directory, os.W_OK) else "not writable: {}".format(directory)
+    if background.job_cache != None:
+        try:
+            background.job_cache.get(metrics_key)
+            checks["job_cache"] = "ok"
+        except Exception as e:
+            checks["job_cache"] = "error: {}".format(e)
+    return checks
+
+def init_health_check(server: flask.Flask, path = "/healthz"):
+    @server.route(path)
+    def healthz():
+        checks = check_health()
+        ready = all(x == "ok" for x in checks.values())
+        return flask.jsonify({"status": "ok" if ready else "unavailable", "pid": os.getpid(), "checks": checks}), 200 if ready else 503
@@ -3,6 +3,7 @@ import dash_bootstrap_components as dbc
 from dash import dash_table
 from dash import dcc, html
 from dash.dash_table.Format import Format
+import config
 
 CONTENT_STYLE = {
     "marginLeft":  "2rem",
@@ -12,6 +13,14 @@ CONTENT_STYLE = {
 
 detailed_setting_id_type = "detailed_settings"
 
+def describe_data_retention():
+    # Same retention as the caches (config.data_ttl, see cache_store.py)
+    text = "Your data and the images made from them are kept on the server, in memory and in a cache directory. "
+    if config.data_ttl == None:
+        return text + "They are deleted only when the space is needed for newer data."
+    return text + ("They are deleted after {:g} hours without use (at the server's next request after that), "
+                   "or earlier when the space is needed for newer data.").format(config.data_ttl_hours)
+
 def layout_upload_section():
     layout = html.Div(
         [
@@ -19,8 +28,7 @@ def layout_upload_section():
             dbc.Alert([
                 "Import Simple Western data exported from Compass. TSV (.tsv), CSV (.csv), and Excel (.xlsx, .xls) files are supported.",
                 html.Br(),
-                "Your data are stored in the user's browser (local storage).",
-                "The server does not retain your files.",
+                describe_data_retention(),
             ], color = "primary"),
             dcc.Upload(
                 id='upload_data',
@@ -252,6 +260,8 @@ def layout_generate_image():
                 dbc.Button("Download Log", id = "download_log_button", disabled = True, className="", outline = False, color = 'secondary'),
                 dbc.Button("Download Both", id = "download_all_button", disabled = True, className="", outline = False, color = 'secondary'),
             ]),
+            dbc.Button('Cancel', id = 'generate_cancel_button', color = 'secondary', className="ms-1", style = {'display': 'none'}),
+            dbc.Progress(id = 'generate_progress', value = 0, className="mt-2", style = {'display': 'none'}),
             html.P(id = 'generate_message'),
 
             html.Br(),
@@ -378,6 +388,8 @@ def layout_normalization_panel():
 
         dbc.Button("Compute Normalized Signals", 
                    id = "calculate_normalized_signal_button", className="mb-3"),
+        dbc.Button("Cancel", id = "calculate_cancel_button", className="mb-3 ms-1", color = 'secondary', style = {'display': 'none'}),
+        dbc.Progress(id = "calculate_progress", value = 0, className="mb-3", style = {'display': 'none'}),
 
         html.H5("Normalization Summary"),
         dash_table.DataTable(
@@ -386,6 +398,7 @@ def layout_normalization_panel():
                 {"id": "sample_name", "name": "Series Name"},
                 {"id": "raw_total_signal", "name": "Raw Total Intensity"},
                 {"id": "factor", "name": "Normalization Factor"},
+                {"id": "stop_mw", "name": "Integration Stop (kDa)"},
                 {"id": "note", "name": "Note"},
             ]
         ),
@@ -398,6 +411,14 @@ def layout_rawdata_panel():
         dash_table.DataTable(
             id = "raw_data_table",
             cell_selectable = False,
+            page_action = "custom",
+            page_current = 0,
+            page_size = config.table_page_size,
+            sort_action = "custom",
+            sort_mode = "multi",
+            sort_by = [],
+            filter_action = "custom",
+            filter_query = "",
         )
     ]
     return layout
@@ -414,10 +435,20 @@ def layout_graph_panel():
 
 def layout_normalized_data_panel():
     layout = [
+        # The table shows only a page. The export is made on the server from the whole (filtered and sorted) table.
+        dbc.Button("Export (.xlsx)", id = "normalized_data_export_button", disabled = True, outline = False, color = 'secondary', className = "mb-2"),
+        dcc.Download(id = "download_normalized_data"),
         dash_table.DataTable(
             id = "normalized_data_table",
             cell_selectable = False,
-            export_format = 'xlsx',
+            page_action = "custom",
+            page_current = 0,
+            page_size = config.table_page_size,
+            sort_action = "custom",
+            sort_mode = "multi",
+            sort_by = [],
+            filter_action = "custom",
+            filter_query = "",
         )
     ]
     return layout
@@ -454,6 +485,11 @@ def app_layout(default_value):
             dcc.Store('store_lane_signal_sum_list'),
             dcc.Store('store_normalize_factor'),
             dcc.Store('store_fileinfo'),
+            dcc.Store('store_raw_dataset'),
+            dcc.Store('store_normalized_dataset'),
+            dcc.Store('store_render_request'),
+            dcc.Store('store_graph_view'),
+            dcc.Store('store_graph_normalized_view'),
         ],
         style = CONTENT_STYLE
 
@@ -0,0 +1,231 @@
+import os
+import sys
+import json
+import time
+import base64
+import argparse
+import subprocess
+import urllib.parse
+import urllib.request
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+############################################################
+#  Minimal Dash client (replays the requests of the browser)
+############################################################
+# The component properties are kept as the browser does: the initial values come from the layout and
+# every callback response updates them. A callback is called with the current values of its inputs and
+# states, and a background callback is polled until its result is ready.
+def request_json(url, payload = None, timeout = 120):
+    # Returns (status, decoded JSON or None)
+    data = None if payload == None else json.dumps(payload).encode('utf-8')
+    request = urllib.request.Request(url, data = data, headers = {"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request, timeout = timeout) as response:
+            body = response.read()
+            return response.status, json.loads(body) if 0 < len(body) else None
+    except urllib.error.HTTPError as e:
+        return e.code, None
+
+def collect_layout_values(node, values):
+    # values: {"id.property": value} of the components with an id
+    if isinstance(node, list):
+        for x in node:
+            collect_layout_values(x, values)
+        return
+    if not isinstance(node, dict) or "props" not in node:
+        return
+    props = node["props"]
+    if "id" in props:
+        component_id = props["id"] if isinstance(props["id"], str) else json.dumps(props["id"], sort_keys = True)
+        for key, value in props.items():
+            if key != "children":
+                values["{}.{}".format(component_id, key)] = value
+    for value in props.values():
+        collect_layout_values(value, values)
+
+def split_outputs(output):
+    # "..a.b...c.d.." -> [("a", "b"), ("c", "d")]. The "@..." suffix of duplicate outputs is removed.
+    parts = output[2:-2].split("...") if output.startswith("..") else [output]
+    return [(x.rsplit(".", 1)[0], x.rsplit(".", 1)[1].split("@")[0]) for x in parts]
+
+class DashClient:
+    def __init__(self, base_url, timeout = 120):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        _, self.dependencies = request_json(self.base_url + "/_dash-dependencies", timeout = timeout)
+        _, layout = request_json(self.base_url + "/_dash-layout", timeout = timeout)
+        self.initial_values = {}
+        collect_layout_values(layout, self.initial_values)
+
+    def find(self, output, trigger):
+        # The server callback with the output ("id.property") and the input (trigger).
+        for dependency in self.dependencies:
+            if dependency.get("clientside_function") != None:
+                continue
+            outputs = ["{}.{}".format(*x) for x in split_outputs(dependency["output"])]
+            inputs = ["{}.{}".format(x["id"], x["property"]) for x in dependency["inputs"]]
+            if output in outputs and trigger in inputs:
+                return dependency
+        raise KeyError("No callback for {} triggered by {}".format(output, trigger))
+
+    def make_dependency_values(self, values, dependencies):
+        ret = []
+        for x in dependencies:
+            if x["id"].startswith("{"):
+                # Pattern matching (ALL): the components of the same type
+                pattern = json.loads(x["id"])
+                matched = []
+                for key, value in values.items():
+                    component_id, prop = key.rsplit(".", 1)
+                    if component_id.startswith("{") and prop == x["property"]:
+                        component_id = json.loads(component_id)
+                        if all(component_id.get(k) == v for k, v in pattern.items() if not isinstance(v, list)):
+                            matched.append({"id": component_id, "property": prop, "value": value})
+                ret.append(matched)
+            else:
+                ret.append({"id": x["id"], "property": x["property"], "value": values.get("{}.{}".format(x["id"], x["property"]))})
+        return ret
+
+    def call(self, values, output, trigger):
+        # Calls the callback and updates values with the response. Returns False if the update was prevented.
+        dependency = self.find(output, trigger)
+        outputs = [{"id": json.loads(x) if x.startswith("{") else x, "property": prop} for x, prop in split_outputs(dependency["output"])]
+        payload = {
+            "output": dependency["output"],
+            "outputs": outputs if dependency["output"].startswith("..") else outputs[0],
+            "inputs": self.make_dependency_values(values, dependency["inputs"]),
+            "state": self.make_dependency_values(values, dependency["state"]),
+            "changedPropIds": [trigger],
+        }
+        url = self.base_url + "/_dash-update-component"
+        status, body = request_json(url, payload, self.timeout)
+        time_start = time.perf_counter()
+        while status == 200 and "cacheKey" in body and "response" not in body:
+            # Background callback: poll as the browser does.
+            if self.timeout < time.perf_counter() - time_start:
+                raise TimeoutError("{} did not finish in {} s".format(output, self.timeout))
+            time.sleep(0.2)
+            job = body
+            status, body = request_json("{}?cacheKey={}&job={}".format(url, job["cacheKey"], job["job"]), payload, self.timeout)
+            if status == 200 and "response" not in body:
+                body = job
+        if status == 204:
+            return False
+        if status != 200:
+            raise RuntimeError("{} returned HTTP {}".format(output, status))
+        for component_id, props in body["response"].items():
+            for prop, value in props.items():
+                values["{}.{}".format(component_id, prop)] = value
+        return True
+
+############################################################
+#  Session: upload -> generate -> normalize
+############################################################
+def run_session(client, filename, contents, timings, n_clicks = 1):
+    # timings: {step name: [seconds]} (appended)
+    # The background jobs are identified by their inputs, so sessions with the same file at the same time
+    # would share the job results. n_clicks (different in each session) keeps them apart, as with real users.
+    values = dict(client.initial_values)
+    def step(name, output, trigger, **updates):
+        values.update(updates)
+        time_start = time.perf_counter()
+        if client.call(values, output, trigger) == False:
+            raise RuntimeError("{}: {} was not updated".format(name, output))
+        timings.setdefault(name, []).append(time.perf_counter() - time_start)
+
+    step("upload", "store_raw_dataset.data", "upload_data.contents",
+         **{"upload_data.contents": contents, "upload_data.filename": os.path.basename(filename)})
+    if values.get("store_raw_dataset.data") == None:
+        raise RuntimeError("{}: upload failed ({})".format(filename, values.get("uploaded_filename.children")))
+    step("raw_table_page", "raw_data_table.data", "store_raw_dataset.data")
+    step("lane_settings", "asis_lane_setting_table.data", "store_raw_dataset.data")
+    step("generate", "resulted_image.src", "generate_button.n_clicks", **{"generate_button.n_clicks": n_clicks})
+    step("download_image", "download_image.data", "download_button.n_clicks", **{"download_button.n_clicks": n_clicks})
+
+    step("lane_relationship", "lane_relationship_table.data", "store_raw_dataset.data")
+    lane_relationship = values["lane_relationship_table.data"]
+    lane_relationship[0]["type"] = "Total"
+    step("normalize", "store_normalized_dataset.data", "calculate_normalized_signal_button.n_clicks",
+         **{"calculate_normalized_signal_button.n_clicks": n_clicks, "normalization_target_dropdown.value": lane_relationship[0]["sample_name"]})
+    step("normalized_table_page", "normalized_data_table.data", "store_normalized_dataset.data")
+
+def summarize(timings, n_errors, elapsed, n_sessions):
+    print("{:24s} {:>6s} {:>9s} {:>9s} {:>9s}".format("step", "count", "p50 (s)", "p95 (s)", "max (s)"))
+    summary = {}
+    for name, times in timings.items():
+        summary[name] = {"count": len(times), "p50": float(np.percentile(times, 50)), "p95": float(np.percentile(times, 95)), "max": max(times)}
+        print("{:24s} {:6d} {:9.3f} {:9.3f} {:9.3f}".format(name, len(times), summary[name]["p50"], summary[name]["p95"], summary[name]["max"]))
+    print("{} sessions in {:.1f} s ({:.2f} sessions/s), {} errors".format(n_sessions, elapsed, n_sessions / elapsed, n_errors))
+    return {"steps": summary, "sessions": n_sessions, "errors": n_errors, "elapsed": elapsed}
+
+def wait_ready(base_url, timeout):
+    time_start = time.perf_counter()
+    while time.perf_counter() - time_start < timeout:
+        try:
+            status, body = request_json(base_url + "/healthz", timeout = 5)
+            if status == 200:
+                return body
+        except (urllib.error.URLError, ConnectionError):
+            pass
+        time.sleep(0.5)
+    raise TimeoutError("{} is not ready after {} s".format(base_url, timeout))
+
+############################################################
+#  Main
+############################################################
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Replay upload -> generate -> normalize sessions against a running server.")
+    parser.add_argument("files", nargs = "*", default = [os.path.join(os.path.dirname(os.path.abspath(__file__)), "example", "example.txt")],
+                        help = "Data files uploaded in the sessions, in turn (default: example/example.txt).")
+    parser.add_argument("--url", default = "http://127.0.0.1:8000", help = "Base URL of the server (default: http://127.0.0.1:8000).")
+    parser.add_argument("--sessions", type = int, default = 20, help = "Number of sessions (default: 20).")
+    parser.add_argument("--concurrency", type = int, default = 4, help = "Sessions running at the same time (default: 4).")
+    parser.add_argument("--timeout", type = float, default = 120, help = "Timeout of a request or a background job in seconds (default: 120).")
+    parser.add_argument("--start", action = "store_true",
+                        help = "Start gunicorn with gunicorn.conf.py on the port of --url for the test, and stop it afterwards.")
+    parser.add_argument("-o", "--output", default = None, help = "Write the summary to this JSON file.")
+    args = parser.parse_args(argv)
+
+    server = None
+    if args.start:
+        port = urllib.parse.urlparse(args.url).port or 8000
+        server = subprocess.Popen(["gunicorn", "-c", "gunicorn.conf.py", "app:server"], cwd = os.path.dirname(os.path.abspath(__file__)),
+                                  env = dict(os.environ, PORT = str(port)))
+    errors = []
+    try:
+        print("Server ready: {}".format(wait_ready(args.url, args.timeout)))
+        client = DashClient(args.url, args.timeout)
+        uploads = []
+        for filename in args.files:
+            with open(filename, 'rb') as f:
+                uploads.append((filename, "data:application/octet-stream;base64," + base64.b64encode(f.read()).decode('ascii')))
+
+        timings = {}
+        def run(i_session):
+            filename, contents = uploads[i_session % len(uploads)]
+            try:
+                run_session(client, filename, contents, timings, n_clicks = i_session + 1)
+                return None
+            except Exception as e:
+                return "session {}: {}".format(i_session, e)
+
+        time_start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers = args.concurrency) as executor:
+            errors = [x for x in executor.map(run, range(args.sessions)) if x != None]
+        elapsed = time.perf_counter() - time_start
+        for error in errors:
+            print(error)
+        summary = summarize(timings, len(errors), elapsed, args.sessions)
+        if args.output != None:
+            with open(args.output, 'w', encoding = 'utf-8') as f:
+                json.dump(summary, f, indent = 2)
+    finally:
+        if server != None:
+            server.terminate()
+            server.wait()
+    return 1 if 0 < len(errors) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
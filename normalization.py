@@ -0,0 +1,199 @@
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+import utilfuncs
+
+mw_column_name = 'kDa'
+
+############################################################
+#  Total Protein Normalization (independent of Dash)
+############################################################
+# The signal data are handled as a matrix: rows are the data points (molecular weights) and
+# columns are the signal series. A stack of matrices (plates * rows * series) is also accepted,
+# so that many plates with the same layout are processed in one call.
+#
+# lane_relationship: list of {"sample_name": str, "type": "Total" | "Target", "associated_lane": str | None}
+# signal_range: (min kDa, max kDa) of the signal integration, or None for the whole data.
+
+def extract_signal_range(signal_matrix, mw_values, signal_range):
+    if signal_range == None:
+        return signal_matrix, mw_values
+    signal_range_min, signal_range_max = signal_range
+    in_range = (signal_range_min <= mw_values) & (mw_values <= signal_range_max)
+    return signal_matrix[..., in_range, :], mw_values[in_range]
+
+def calc_signal_sums(signal_matrix, mw_values, stop_summation_negative = False):
+    # Returns the signal sum of each series and the molecular weight where the summation stopped
+    # (NaN if the whole series was summed). Missing values (NaN) are skipped.
+    # Each series is made contiguous (series * rows) before the reduction, so that the sums are
+    # identical to the column sums of pandas.
+    series_major = np.ascontiguousarray(np.moveaxis(signal_matrix, -2, -1))
+    if stop_summation_negative != True:
+        signal_sums = np.nansum(series_major, axis = -1)
+        return signal_sums, np.full(signal_sums.shape, np.nan)
+
+    # Sum from high to low molecular weight, stopping at the first negative value.
+    order = np.argsort(-mw_values, kind = 'stable')
+    signal_sums, stop_index = utilfuncs.sum_positive_region(series_major[..., order])
+    sorted_mw_values = np.append(mw_values[order], np.nan)
+    return signal_sums, sorted_mw_values[stop_index]
+
+class SignalSumIndex:
+    # Precomputed prefix sums over the data sorted from high to low molecular weight.
+    # The signal sum of any kDa window (optionally stopping at the first negative value) is answered
+    # by binary searches and a subtraction, without touching the data again.
+    # The differences carry the rounding error of the prefix sums (np.longdouble is float64 on some platforms),
+    # so the index is used for the live summary only. Calculate sums the data (calc_signal_sums()).
+    # A window without non-zero values is exactly 0, so that Blank lanes keep their factor (see calc_factors()).
+    def __init__(self, raw_dataframe: pd.DataFrame):
+        self.series_names, sorted_series, self.sorted_mw_values = utilfuncs.sort_series_by_mw(raw_dataframe, mw_column_name)
+        n_series, n_rows = sorted_series.shape
+        # Accumulate in extended precision to keep the rounding error of the differences small.
+        self.prefix_sums = np.zeros((n_series, n_rows + 1), dtype = np.longdouble)
+        np.cumsum(np.nan_to_num(sorted_series), axis = -1, dtype = np.longdouble, out = self.prefix_sums[:, 1:])
+        # Number of the non-zero values (NaN is skipped)
+        self.prefix_nonzero_counts = np.zeros((n_series, n_rows + 1), dtype = np.int64)
+        np.cumsum(np.nan_to_num(sorted_series) != 0.0, axis = -1, out = self.prefix_nonzero_counts[:, 1:])
+        # Sorted positions of the negative values of each series
+        self.negative_positions = [np.flatnonzero(x < 0.0) for x in sorted_series]
+        self.ascending_mw_values = self.sorted_mw_values[::-1]
+        self.nbytes = self.prefix_sums.nbytes + self.prefix_nonzero_counts.nbytes + self.sorted_mw_values.nbytes + sum(x.nbytes for x in self.negative_positions)
+
+    def find_window(self, signal_range = None):
+        # Returns [start, end) of the rows (in the sorted order) where min <= kDa <= max.
+        n_rows = len(self.sorted_mw_values)
+        if signal_range == None:
+            return 0, n_rows
+        signal_range_min, signal_range_max = signal_range
+        start = n_rows - np.searchsorted(self.ascending_mw_values, signal_range_max, side = 'right')
+        end = n_rows - np.searchsorted(self.ascending_mw_values, signal_range_min, side = 'left')
+        return start, max(start, end)
+
+    def calc_signal_sums(self, signal_range = None, stop_summation_negative = False):
+        # Same as calc_signal_sums() on the extracted data: returns (signal sums, stop molecular weights).
+        start, end = self.find_window(signal_range)
+        stop_index = np.full(len(self.series_names), end)
+        if stop_summation_negative == True:
+            for i, negative_positions in enumerate(self.negative_positions):
+                j = np.searchsorted(negative_positions, start)
+                if j < len(negative_positions) and negative_positions[j] < end:
+                    stop_index[i] = negative_positions[j]
+        rows = np.arange(len(self.series_names))
+        signal_sums = (self.prefix_sums[rows, stop_index] - self.prefix_sums[:, start]).astype(np.float64)
+        signal_sums[self.prefix_nonzero_counts[rows, stop_index] == self.prefix_nonzero_counts[:, start]] = 0.0
+        stop_mw_values = np.where(stop_index < end, np.append(self.sorted_mw_values, np.nan)[stop_index], np.nan)
+        return signal_sums, stop_mw_values
+
+def calc_factors(signal_sums, series_names, lane_relationship, normalization_target):
+    # signal_sums: (..., series). Returns the factor applied to each record of lane_relationship: (..., records)
+    series_index = {x: i for i, x in enumerate(series_names)}
+    total_protein_columns = [x["sample_name"] for x in filter(lambda x: x["type"] == "Total", lane_relationship)]
+
+    ref_signal = signal_sums[..., series_index[normalization_target]]
+    factors = {}
+    for x in total_protein_columns:
+        total_signal = signal_sums[..., series_index[x]]
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            factors[x] = np.where(total_signal != 0, ref_signal / total_signal, 0.0)
+
+    used_factors = []
+    for record in lane_relationship:
+        factor = np.ones_like(ref_signal, dtype = np.float64)
+        if record['type'] == "Total":
+            factor = factors[record["sample_name"]]
+        elif record['type'] == "Target":
+            associated_lane = record.get("associated_lane")
+            if associated_lane != None and associated_lane in factors:
+                factor = factors[associated_lane]
+        used_factors.append(factor)
+    return np.stack(used_factors, axis = -1)
+
+def normalize_matrix(signal_matrix, mw_values, series_names, lane_relationship, normalization_target,
+                     signal_range = None, stop_summation_negative = False):
+    # Returns (normalized matrix, mw values, signal sums, factors, stop molecular weights).
+    # The columns of the normalized matrix and the values of each series follow the order of lane_relationship.
+    signal_matrix = np.asarray(signal_matrix, dtype = np.float64)
+    mw_values = np.asarray(mw_values, dtype = np.float64)
+    signal_matrix, mw_values = extract_signal_range(signal_matrix, mw_values, signal_range)
+
+    signal_sums, stop_mw_values = calc_signal_sums(signal_matrix, mw_values, stop_summation_negative)
+    used_factors = calc_factors(signal_sums, series_names, lane_relationship, normalization_target)
+
+    columns = [list(series_names).index(x["sample_name"]) for x in lane_relationship]
+    normalized_matrix = signal_matrix[..., columns] * used_factors[..., np.newaxis, :]
+    return normalized_matrix, mw_values, signal_sums[..., columns], used_factors, stop_mw_values[..., columns]
+
+def make_summary(lane_relationship, normalization_target, signal_sums, used_factors, stop_mw_values):
+    is_reference = lambda x: True if (x["type"] == "Total" and x["sample_name"] == normalization_target) or (x["type"] == "Target" and x.get("associated_lane") == normalization_target) else None
+    summary = []
+    for i, x in enumerate(lane_relationship):
+        factor = float(used_factors[i])
+        signal_sum = float(signal_sums[i])
+        note = "Reference" if is_reference(x) else ("Not Normalized" if factor == float(1) else "Blank" if signal_sum == 0 else "")
+        stop_mw = float(stop_mw_values[i]) if not np.isnan(stop_mw_values[i]) else None
+        summary.append({"sample_name": x["sample_name"], "raw_total_signal": signal_sum, "factor": factor,
+                        "stop_mw": stop_mw, "note": note})
+    return summary
+
+def split_dataframe(raw_dataframe: pd.DataFrame):
+    series_names = [x for x in raw_dataframe.columns if x != mw_column_name]
+    signal_matrix = raw_dataframe[series_names].to_numpy(dtype = np.float64)
+    mw_values = raw_dataframe[mw_column_name].to_numpy(dtype = np.float64)
+    return signal_matrix, mw_values, series_names
+
+def make_result_dataframe(normalized_matrix, mw_values, lane_relationship):
+    result_df = pd.DataFrame(normalized_matrix, columns = [x["sample_name"] for x in lane_relationship])
+    result_df.insert(0, mw_column_name, mw_values)
+    return result_df
+
+def normalize(raw_dataframe: pd.DataFrame, lane_relationship: list[dict], normalization_target: str,
+              signal_range = None, stop_summation_negative = False):
+    signal_matrix, mw_values, series_names = split_dataframe(raw_dataframe)
+    normalized_matrix, mw_values, signal_sums, used_factors, stop_mw_values = normalize_matrix(
+        signal_matrix, mw_values, series_names, lane_relationship, normalization_target,
+        signal_range = signal_range, stop_summation_negative = stop_summation_negative)
+
+    result_df = make_result_dataframe(normalized_matrix, mw_values, lane_relationship)
+    summary = make_summary(lane_relationship, normalization_target, signal_sums, used_factors, stop_mw_values)
+    return result_df, summary
+
+def summarize(signal_sum_index: SignalSumIndex, lane_relationship: list[dict], normalization_target: str,
+              signal_range = None, stop_summation_negative = False):
+    # Normalization Summary only (without the normalized data).
+    signal_sums, stop_mw_values = signal_sum_index.calc_signal_sums(signal_range, stop_summation_negative)
+    used_factors = calc_factors(signal_sums, signal_sum_index.series_names, lane_relationship, normalization_target)
+    columns = [signal_sum_index.series_names.index(x["sample_name"]) for x in lane_relationship]
+    return make_summary(lane_relationship, normalization_target, signal_sums[columns], used_factors, stop_mw_values[columns])
+
+
+############################################################
+#  Batch Normalization (many files / plates)
+############################################################
+def normalize_batch(datasets: dict, lane_relationship: list[dict], normalization_target: str,
+                    signal_range = None, stop_summation_negative = False, max_workers = None):
+    # datasets: {name: DataFrame}. Returns {name: (result_df, summary)}.
+    # Datasets sharing the same molecular weights and series are stacked and normalized at once.
+    groups = {}
+    for name, df in datasets.items():
+        signal_matrix, mw_values, series_names = split_dataframe(df)
+        group_key = (tuple(series_names), mw_values.tobytes())
+        groups.setdefault(group_key, []).append((name, signal_matrix, mw_values, series_names))
+
+    def normalize_group(members):
+        _, _, mw_values, series_names = members[0]
+        stacked_matrix = np.stack([x[1] for x in members])
+        normalized_stack, mw_values, signal_sums, used_factors, stop_mw_values = normalize_matrix(
+            stacked_matrix, mw_values, series_names, lane_relationship, normalization_target,
+            signal_range = signal_range, stop_summation_negative = stop_summation_negative)
+        ret = {}
+        for i, (name, _, _, _) in enumerate(members):
+            result_df = make_result_dataframe(normalized_stack[i], mw_values, lane_relationship)
+            summary = make_summary(lane_relationship, normalization_target, signal_sums[i], used_factors[i], stop_mw_values[i])
+            ret[name] = (result_df, summary)
+        return ret
+
+    results = {}
+    with ThreadPoolExecutor(max_workers = max_workers) as executor:
+        for ret in executor.map(normalize_group, groups.values()):
+            results.update(ret)
+    return {name: results[name] for name in datasets}
@@ -0,0 +1,186 @@
+import io
+import threading
+import contextlib
+from datetime import datetime
+import config
+from cache_store import MemoryStore
+
+############################################################
+#  Default Value Set up
+############################################################
+default_values = {
+    "offset_top":   40,
+    "offset_bottom":    40,
+    "offset_left":  40,
+    "offset_right": 40,
+    "band_width": 20,
+    "band_spacing": 10,
+    "lane_label_size": 16,
+    "mw_label_size": 16
+}
+
+############################################################
+#  Render the band image from the settings (independent of Dash)
+############################################################
+# render_settings is a JSON-serializable dict:
+#   plot_indices, plot_labels, write_label, rotate_label, signal_limit,
+#   mw_range ([min, max] or None), draw_marker_line, write_text, marker_molecular_weights,
+#   band_width, band_spacing, offset_top, offset_bottom, offset_left, offset_right,
+#   lane_label_size, mw_label_size,
+#   field_height (optional, None: one pixel per data point), pooling (optional, 'max' or 'mean')
+# The plot objects are kept per dataset, so that the next render of the same dataset reuses the layers
+# which do not depend on the changed settings (e.g. the band raster when only the labels are changed).
+plot_objects = MemoryStore(config.dataset_cache_mb * 1024 * 1024, sizeof = lambda x: int(x[0].data.memory_usage().sum()),
+                           max_age = config.data_ttl)
+plot_objects_lock = threading.Lock()
+
+@contextlib.contextmanager
+def plot_object(dataframe, dataset_id = None):
+    import band_plot_utils
+    # Yields a WesternBlotPlotUtil of the data, which is used by one render at a time.
+    if dataset_id == None:
+        yield band_plot_utils.WesternBlotPlotUtil(dataframe, [], offset = 40)
+        return
+    with plot_objects_lock:
+        entry = plot_objects.get(dataset_id)
+        if entry == None:
+            entry = (band_plot_utils.WesternBlotPlotUtil(dataframe, [], offset = 40), threading.Lock())
+            plot_objects.put(dataset_id, entry)
+    plot_obj, lock = entry
+    with lock:
+        yield plot_obj
+
+def draw_plot(plot_obj, render_settings, stats: dict | None = None):
+    import utilfuncs
+    # If stats (dict) is given, the render time (and with config.report_render_memory, the peak memory allocated
+    # while drawing) are stored in it.
+    plot_obj.set_plot_indices(render_settings["plot_indices"])
+    plot_obj.set_plot_labels(render_settings["plot_labels"])
+
+    if render_settings["mw_range"] != None:
+        plot_obj.set_molecular_weight_range(*render_settings["mw_range"])
+    else:
+        plot_obj.set_molecular_weight_range()
+    plot_obj.set_marker_molecular_weights([tuple(x) for x in render_settings["marker_molecular_weights"]])
+
+    plot_obj.set_band_width(render_settings["band_width"], render_settings["band_spacing"])
+    plot_obj.set_offset(
+        offset_top = render_settings["offset_top"], offset_bottom = render_settings["offset_bottom"],
+        offset_left = render_settings["offset_left"], offset_right = render_settings["offset_right"]
+    )
+    plot_obj.set_font_size(label_font_size = render_settings["lane_label_size"], marker_font_size = render_settings["mw_label_size"])
+    plot_obj.set_field_height(render_settings.get("field_height"), render_settings.get("pooling", "max"))
+
+    with utilfuncs.measure(stats, "render_time", trace_memory = config.report_render_memory):
+        plot_obj.draw_bands(
+                signal_max = render_settings["signal_limit"],
+                draw_marker_line = render_settings["draw_marker_line"],
+                write_text = render_settings["write_text"], rotate_label = render_settings["rotate_label"],
+                write_label = render_settings["write_label"])
+    if stats != None:
+        stats["image_memory"] = plot_obj.image.width * plot_obj.image.height
+    return plot_obj
+
+def render_image(dataframe, render_settings, dataset_id = None, stats = None):
+    with plot_object(dataframe, dataset_id) as plot_obj:
+        return draw_plot(plot_obj, render_settings, stats).get_image_obj()
+
+def render_preview(dataframe, render_settings, max_field_height, dataset_id = None, stats = None):
+    # Render at most max_field_height rows (e.g. the screen height) for the preview.
+    # Returns (image, True if the image is the same as the full resolution image).
+    if max_field_height == None or max_field_height == 0:
+        return render_image(dataframe, render_settings, dataset_id, stats), True
+    with plot_object(dataframe, dataset_id) as plot_obj:
+        draw_plot(plot_obj, dict(render_settings, field_height = max_field_height), stats)
+        return plot_obj.get_image_obj(), not plot_obj.resampled
+
+def render_pyramid(dataframe, render_settings, tile_height = 512):
+    # Tiled pyramid: level 0 is the full resolution, and each next level halves the field height
+    # until the field fits in a tile. Each level is a list of tiles (horizontal strips of tile_height px).
+    levels = []
+    field_height = None
+    with plot_object(dataframe) as plot_obj:
+        while True:
+            draw_plot(plot_obj, dict(render_settings, field_height = field_height))
+            img = plot_obj.get_image_obj()
+            levels.append([img.crop((0, y, img.width, min(y + tile_height, img.height))) for y in range(0, img.height, tile_height)])
+            (_, field_top), (_, field_bottom) = plot_obj.field_rectangle
+            if field_bottom - field_top <= tile_height:
+                break
+            field_height = (field_bottom - field_top) // 2
+    return levels
+
+############################################################
+#  Encode the image
+############################################################
+# All formats are lossless.
+image_formats = {
+    "png":  {"format": "PNG",  "mime_type": "image/png",  "extension": ".png"},
+    "webp": {"format": "WEBP", "mime_type": "image/webp", "extension": ".webp"},
+    "tiff": {"format": "TIFF", "mime_type": "image/tiff", "extension": ".tif"},
+}
+
+def make_encoding(image_format):
+    # JSON-serializable description of the encoder (a part of the render cache key)
+    if image_format not in image_formats:
+        raise ValueError("Unknown image format: {}".format(image_format))
+    return {"image_format": image_format, "png_compress_level": config.png_compress_level if image_format == "png" else None}
+
+def encode_image(img, encoding) -> bytes:
+    image_format = encoding["image_format"]
+    options = {}
+    if image_format == "png":
+        options["compress_level"] = encoding["png_compress_level"]
+    elif image_format == "webp":
+        options["lossless"] = True
+    elif image_format == "tiff":
+        options["compression"] = "tiff_adobe_deflate"
+    img_byte_arr = io.BytesIO()
+    img.save(img_byte_arr, format = image_formats[image_format]["format"], **options)
+    return img_byte_arr.getvalue()
+
+def make_log_text(filename, draw_type, lane_records, log_details = ""):
+    # lane_records: list of {"sample_name": str, "label": str | None} in the lane order.
+    log_stream = io.StringIO()
+    now = datetime.now()
+    print("DateTime: {}".format(now), file = log_stream)
+    print("DataFile: {}".format(filename), file = log_stream)
+    print("Drawing Mode: {}".format("As Is" if draw_type == "as_is" else "Normalized"), file = log_stream)
+    print("", file = log_stream)    # insert blank line
+    print("Lane Order", file = log_stream)
+    for lane_index, record in enumerate(lane_records):
+        print("{}\t{}\t{}".format(
+            lane_index+1, 
+            record["sample_name"],
+            record["label"] if record["label"] and 0 < len(record["label"]) else ""
+        ), file = log_stream)
+    print("", file = log_stream)    # insert blank line
+
+    log_text = log_stream.getvalue()
+    log_stream.close()
+    return log_text + log_details
+
+def describe_render_settings(render_settings) -> str:
+    log_stream = io.StringIO()
+    signal_limit = render_settings["signal_limit"]
+    print("Signal Limit:\t{}".format("Not specified" if signal_limit == None else signal_limit), file = log_stream)
+    if render_settings["mw_range"] != None:
+        print("Draw Range: \t Min: {} kDa, Max: {} kDa".format(*render_settings["mw_range"]), file = log_stream)
+    print("Band Width:\t {} px".format(render_settings["band_width"]), file = log_stream)
+    print("Band Spacing:\t {} px".format(render_settings["band_spacing"]), file = log_stream)
+    print("Margin Top:\t {} px".format(render_settings["offset_top"]), file = log_stream)
+    print("Margin Bottom:\t{} px".format(render_settings["offset_bottom"]), file = log_stream)
+    print("Margin Left:\t {} px".format(render_settings["offset_left"]), file = log_stream)
+    print("Margin Right:\t {} px".format(render_settings["offset_right"]), file = log_stream)
+    print("Lane Label Size:\t {} pt".format(render_settings["lane_label_size"]), file = log_stream)
+    print("Molecular Weights Label Size:\t {} pt".format(render_settings["mw_label_size"]), file = log_stream)
+    if render_settings.get("field_height") != None:
+        print("Field Height:\t {} px ({} pooling)".format(render_settings["field_height"], render_settings.get("pooling", "max")), file = log_stream)
+    return log_stream.getvalue()
+
+def describe_render_stats(stats) -> str:
+    # stats: filled by draw_plot()
+    if "peak_memory" not in stats:
+        return "Render:\t {:.3f} s, image {:.1f} MB\n".format(stats["render_time"], stats["image_memory"] / 1024 / 1024)
+    return "Render:\t {:.3f} s, {:.1f} MB allocated, image {:.1f} MB\n".format(
+        stats["render_time"], stats["peak_memory"] / 1024 / 1024, stats["image_memory"] / 1024 / 1024)
@@ -0,0 +1,70 @@
+import os
+import json
+import struct
+import hashlib
+
+import config
+import instrumentation
+from cache_store import MemoryStore, DiskStore, make_private_dir
+
+############################################################
+#  Cache of the encoded images
+############################################################
+def make_render_key(dataset_id: str, render_settings: dict, encoding: dict | None = None) -> str:
+    # dataset_id is the content hash of the data, so the key changes whenever the data, any setting or the encoder changes.
+    key_source = json.dumps({"dataset_id": dataset_id, "settings": render_settings, "encoding": encoding}, sort_keys = True, default = str)
+    return hashlib.sha256(key_source.encode('utf-8')).hexdigest()
+
+# Each entry is the encoded image with a description of it (e.g. whether the image is resampled):
+#   4 bytes: length of the info (little endian), info (JSON), encoded image
+def pack_entry(value: bytes, info: dict) -> bytes:
+    info_bytes = json.dumps(info).encode('utf-8')
+    return struct.pack("<I", len(info_bytes)) + info_bytes + value
+
+def unpack_entry(entry: bytes):
+    # Returns (encoded image, info), or None if the entry is not valid.
+    try:
+        info_length = struct.unpack_from("<I", entry)[0]
+        info = json.loads(entry[4:4 + info_length])
+    except (ValueError, struct.error):
+        return None
+    if not isinstance(info, dict):
+        return None
+    return entry[4 + info_length:], info
+
+class RenderCache:
+    def __init__(self, max_bytes: int, cache_dir: str | None = None, max_age: float | None = None):
+        self.memory = MemoryStore(max_bytes, max_age = max_age)
+        self.disk = None
+        if cache_dir != None:
+            self.disk = DiskStore(os.path.join(make_private_dir(cache_dir), "renders"), max_bytes, max_age)
+
+    def get_entry(self, key: str):
+        # Returns (encoded image, info), or None.
+        # The lookups are counted at /metrics (tpn_render_cache_lookups_total, see instrumentation.py).
+        result = "memory"
+        entry = self.memory.get(key)
+        if entry == None and self.disk != None:
+            result = "disk"
+            entry = self.disk.get(key)
+            if entry != None:
+                self.memory.put(key, entry)
+        if entry != None:
+            entry = unpack_entry(entry)
+        if entry == None:
+            result = "miss"
+        instrumentation.metric_store.observe([("tpn_render_cache_lookups_total", (("result", result),), 1)])
+        return entry
+
+    def get(self, key: str) -> bytes | None:
+        entry = self.get_entry(key)
+        return None if entry == None else entry[0]
+
+    def put(self, key: str, value: bytes, info: dict | None = None):
+        entry = pack_entry(value, info or {})
+        self.memory.put(key, entry)
+        if self.disk != None:
+            self.disk.put(key, entry)
+
+render_cache = RenderCache(config.render_cache_mb * 1024 * 1024,
+                           config.render_cache_dir if config.shared_render_cache else None, config.data_ttl)
@@ -0,0 +1,138 @@
+import hashlib
+import numpy as np
+import pandas as pd
+import plotly.graph_objs as go
+from dash import Patch, no_update
+from dash.exceptions import PreventUpdate
+
+import config
+import utilfuncs
+from cache_store import MemoryStore
+
+mw_column_name = 'kDa'
+
+############################################################
+#  Line plots of the signal series (raw and normalized data)
+############################################################
+# Each series is drawn on a uniform x axis (0-1) labeled with the molecular weights, with at most
+# config.graph_point_budget points in the visible window.
+#
+# The decimated arrays of each series are memoized by the content of the series (and the kDa values),
+# so that a new dataset sharing some series with the previous one (e.g. a recalculated normalization)
+# reuses them, and only the changed traces are sent to the browser as a Patch.
+#
+# view (kept in a dcc.Store next to the graph): {"dataset_id", "layout_key", "x_window", "series_keys"}
+
+# (series key, start row, end row, point budget) -> (x, y, text)
+trace_cache = MemoryStore(config.graph_cache_mb * 1024 * 1024, sizeof = lambda x: sum(a.nbytes for a in x), max_age = config.data_ttl)
+# dataset_id -> (layout key, series keys)
+series_key_cache = MemoryStore(1024 * 1024, sizeof = lambda x: 64 * (len(x[1]) + 1), max_age = config.data_ttl)
+
+def parse_x_window(relayout_data):
+    # Returns the zoomed x range [min, max], or None if the graph is reset to the whole range.
+    # Raises PreventUpdate if the x range is not changed (e.g. a legend click).
+    if not isinstance(relayout_data, dict):
+        raise PreventUpdate
+    if relayout_data.get("xaxis.autorange") == True:
+        return None
+    if "xaxis.range[0]" in relayout_data and "xaxis.range[1]" in relayout_data:
+        return [relayout_data["xaxis.range[0]"], relayout_data["xaxis.range[1]"]]
+    if isinstance(relayout_data.get("xaxis.range"), list):
+        return list(relayout_data["xaxis.range"])
+    raise PreventUpdate
+
+def calc_row_window(n_rows, x_window):
+    if x_window == None:
+        return 0, n_rows
+    # One more point on each side so that the lines reach the edges of the view.
+    start = min(n_rows, max(0, int(np.floor(min(x_window) * (n_rows - 1))) - 1))
+    end = max(start, min(n_rows, int(np.ceil(max(x_window) * (n_rows - 1))) + 2))
+    return start, end
+
+def get_series_keys(dataset_id, df: pd.DataFrame):
+    # Returns (layout key, [key of each series]). The layout key changes with the kDa values or the series names.
+    ret = series_key_cache.get(dataset_id)
+    if ret == None:
+        series_names = [x for x in df.columns if x != mw_column_name]
+        mw_digest = hashlib.sha256(df[mw_column_name].to_numpy(dtype = np.float64).tobytes()).digest()
+        layout_hasher = hashlib.sha256(mw_digest)
+        series_keys = []
+        for x in series_names:
+            layout_hasher.update(str(x).encode('utf-8') + b'\0')
+            hasher = hashlib.sha256(mw_digest)
+            hasher.update(df[x].to_numpy(dtype = np.float64).tobytes())
+            series_keys.append(hasher.hexdigest())
+        ret = (layout_hasher.hexdigest(), series_keys)
+        series_key_cache.put(dataset_id, ret)
+    return ret
+
+def get_trace_arrays(df: pd.DataFrame, series_keys, row_window):
+    # Returns [(x, y, text)] of the series in row_window, decimated to config.graph_point_budget points.
+    start, end = row_window
+    series_names = [x for x in df.columns if x != mw_column_name]
+    cache_keys = [(x, start, end, config.graph_point_budget) for x in series_keys]
+    trace_arrays = [trace_cache.get(x) for x in cache_keys]
+
+    missing = [i for i, x in enumerate(trace_arrays) if x == None]
+    if 0 < len(missing):
+        x_uniform = np.linspace(0, 1, len(df))
+        mw_values = df[mw_column_name].to_numpy()
+        signal_matrix = df[[series_names[i] for i in missing]].to_numpy(dtype = np.float64)[start:end]
+        kept_indices = utilfuncs.calc_minmax_decimation_indices(signal_matrix, config.graph_point_budget)
+        for j, i in enumerate(missing):
+            indices = start + kept_indices[j]
+            trace_arrays[i] = (x_uniform[indices], signal_matrix[kept_indices[j], j], mw_values[indices])
+            trace_cache.put(cache_keys[i], trace_arrays[i])
+    return trace_arrays
+
+def make_trace(name, trace_array):
+    x, y, text = trace_array
+    return go.Scattergl(
+        x = x, y = y, name = name, showlegend=True,
+        text=text,
+        hovertemplate= name + '<br>x: %{text}<br>y: %{y}<extra></extra>' )
+
+def make_figure(df: pd.DataFrame, trace_arrays, uirevision):
+    n_rows = len(df)
+    x_uniform = np.linspace(0, 1, n_rows)
+    mw_values = df[mw_column_name].to_numpy()
+    series_names = [x for x in df.columns if x != mw_column_name]
+
+    fig = go.Figure()
+    for name, trace_array in zip(series_names, trace_arrays):
+        fig.add_trace(make_trace(name, trace_array))
+    tick_step = 10 * max(1, -(-n_rows // config.graph_point_budget))
+    fig.update_layout(
+        xaxis=dict(
+            tickvals = x_uniform[::tick_step],
+            ticktext = mw_values[::tick_step],
+        ),
+        # Keep the zoom (and the hidden series) while the kDa values and the series are the same.
+        uirevision = uirevision,
+    )
+    return fig
+
+def build_figure(dataset_id, df: pd.DataFrame, previous_view = None, x_window = None, zoomed = False):
+    # Returns (figure, Patch or no_update; new view).
+    # If zoomed is False and the previous view has the same layout, the previous zoom is kept and
+    # only the changed traces are updated.
+    layout_key, series_keys = get_series_keys(dataset_id, df)
+    same_layout = isinstance(previous_view, dict) and previous_view.get("layout_key") == layout_key
+    if zoomed == False and same_layout == True:
+        x_window = previous_view["x_window"]
+    trace_arrays = get_trace_arrays(df, series_keys, calc_row_window(len(df), x_window))
+    view = {"dataset_id": dataset_id, "layout_key": layout_key, "x_window": x_window, "series_keys": series_keys}
+
+    if zoomed == True or same_layout == False:
+        return make_figure(df, trace_arrays, layout_key), view
+
+    changed = [i for i, x in enumerate(series_keys) if x != previous_view["series_keys"][i]]
+    if len(changed) == 0:
+        return no_update, view
+    patched_figure = Patch()
+    for i in changed:
+        x, y, text = trace_arrays[i]
+        patched_figure["data"][i]["x"] = x
+        patched_figure["data"][i]["y"] = y
+        patched_figure["data"][i]["text"] = text
+    return patched_figure, view
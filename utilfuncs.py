@@ -1,6 +1,52 @@
+import time
+import threading
+import tracemalloc
+import contextlib
+import numpy as np
 import pandas as pd
 import re
 
+# tracemalloc is process-global: tracing is started by the first measure() running and stopped by the last one.
+# There is only one peak, so before a block resets it, the peak so far is folded into the blocks already running
+# (tracing_peaks). Nested or concurrent blocks thus never lose each other's peak.
+tracing_lock = threading.Lock()
+tracing_peaks = {}
+tracing_started = False
+
+@contextlib.contextmanager
+def measure(stats: dict | None, time_key: str, trace_memory = True):
+    # Stores the elapsed time (stats[time_key]) and, if trace_memory, the peak memory allocated in the block (stats["peak_memory"]).
+    # NumPy arrays are counted (traced by tracemalloc), Pillow images are not. Does nothing if stats is None.
+    # Tracing slows down allocation-heavy code, so the memory is traced only where it is asked for.
+    # Blocks running at the same time (threads) also count the allocations of each other.
+    global tracing_started
+    if stats == None:
+        yield
+        return
+    token = object()
+    if trace_memory:
+        with tracing_lock:
+            if len(tracing_peaks) == 0:
+                tracing_started = not tracemalloc.is_tracing()
+                if tracing_started:
+                    tracemalloc.start()
+            traced_memory_start, peak = tracemalloc.get_traced_memory()
+            for key in tracing_peaks:
+                tracing_peaks[key] = max(tracing_peaks[key], peak)
+            tracemalloc.reset_peak()
+            tracing_peaks[token] = traced_memory_start
+    time_start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats[time_key] = time.perf_counter() - time_start
+        if trace_memory:
+            with tracing_lock:
+                peak = max(tracing_peaks.pop(token), tracemalloc.get_traced_memory()[1])
+                stats["peak_memory"] = peak - traced_memory_start
+                if len(tracing_peaks) == 0 and tracing_started:
+                    tracemalloc.stop()
+
 def calc_signal_sum(df: pd.DataFrame, mw_column_name: str = 'kDa'):
     ret = {}
     for column in df.columns:
@@ -20,20 +66,68 @@ def calc_signal_sum2(df: pd.DataFrame, mw_column_name: str = 'kDa'):
         ret[column] = signal_sum
     return ret
 
+def find_first_negative_index(sorted_series):
+    # sorted_series: (..., series, rows), rows sorted from high to low molecular weight.
+    # Returns the position of the first negative value in each series (the number of rows if there is none).
+    if sorted_series.shape[-1] == 0:
+        return np.zeros(sorted_series.shape[:-1], dtype = np.intp)
+    negative = sorted_series < 0.0
+    return np.where(negative.any(axis = -1), negative.argmax(axis = -1), sorted_series.shape[-1])
+
+def sum_until(sorted_series, stop_index):
+    # Sum of sorted_series[..., i, :stop_index[..., i]] for each series. NaN is skipped.
+    # Series sharing the same stop position are summed at once over contiguous rows,
+    # so that the results are identical to the sum of each pandas column.
+    flat_stop_index = np.asarray(stop_index).reshape(-1)
+    flat_series = np.ascontiguousarray(sorted_series).reshape(len(flat_stop_index), sorted_series.shape[-1])
+    signal_sums = np.zeros(len(flat_stop_index))
+    for stop in np.unique(flat_stop_index):
+        selected = flat_stop_index == stop
+        signal_sums[selected] = np.nansum(flat_series[selected, :stop], axis = -1)
+    return signal_sums.reshape(np.shape(stop_index))
+
+def sort_series_by_mw(df: pd.DataFrame, mw_column_name: str = 'kDa'):
+    # Returns the series names, the series matrix (series * rows) and the molecular weights, sorted from high to low MW.
+    columns = [x for x in df.columns if x != mw_column_name]
+    mw_values = df[mw_column_name].to_numpy(dtype = np.float64)
+    order = np.argsort(-mw_values, kind = 'stable')
+    sorted_series = np.ascontiguousarray(df[columns].to_numpy(dtype = np.float64).T[:, order])
+    return columns, sorted_series, mw_values[order]
+
+def sum_positive_region(sorted_series):
+    # sorted_series: (..., series, rows), rows sorted from high to low molecular weight.
+    # Returns (signal sums until the first negative value, the position of that value) of each series.
+    # Used by the normalization (normalization.calc_signal_sums()).
+    stop_index = find_first_negative_index(sorted_series)
+    return sum_until(sorted_series, stop_index), stop_index
+
 def calc_signal_sum_positive_region(df: pd.DataFrame, mw_column_name: str = 'kDa'):
-    ret = {}
-    sorted_df = df.sort_values(by = mw_column_name, ascending = False).reset_index(drop = True)
-    for column in sorted_df.columns:
-        if column == mw_column_name:
-            continue
-        negative_indices = sorted_df[sorted_df[column] < 0.0].index
-        if not negative_indices.empty:
-            stop_index = negative_indices[0]
-        else:
-            stop_index = len(sorted_df[column])
-        #print("{}: {} {}".format(column, stop_index, sorted_df[mw_column_name][0:stop_index]))
-        signal_sum = sorted_df[column][0:stop_index].sum()
-        ret[column] = signal_sum
+    columns, sorted_series, _ = sort_series_by_mw(df, mw_column_name)
+    signal_sums, _ = sum_positive_region(sorted_series)
+    return dict(zip(columns, signal_sums))
+
+def calc_minmax_decimation_indices(signal_matrix, n_points: int):
+    # signal_matrix: rows * series. Returns the indices of the rows kept for each series (list of arrays).
+    # The rows are split into n_points // 2 buckets and the minimum and the maximum of each bucket are kept,
+    # so that the peaks (and the dips) survive the decimation. NaN is ignored.
+    signal_matrix = np.asarray(signal_matrix, dtype = np.float64)
+    n_rows, n_series = signal_matrix.shape
+    if n_rows <= n_points:
+        return [np.arange(n_rows) for _ in range(n_series)]
+    n_buckets = max(1, n_points // 2)
+    bucket_size = -(-n_rows // n_buckets)
+    is_nan = np.isnan(signal_matrix)
+    low = np.full((n_buckets * bucket_size, n_series), np.inf)
+    low[:n_rows] = np.where(is_nan, np.inf, signal_matrix)
+    high = np.full((n_buckets * bucket_size, n_series), -np.inf)
+    high[:n_rows] = np.where(is_nan, -np.inf, signal_matrix)
+    bucket_offsets = (np.arange(n_buckets) * bucket_size)[:, np.newaxis]
+    min_indices = bucket_offsets + low.reshape(n_buckets, bucket_size, n_series).argmin(axis = 1)
+    max_indices = bucket_offsets + high.reshape(n_buckets, bucket_size, n_series).argmax(axis = 1)
+    ret = []
+    for i in range(n_series):
+        indices = np.unique(np.concatenate([[0, n_rows - 1], min_indices[:, i], max_indices[:, i]]))
+        ret.append(indices[indices < n_rows])
     return ret
 
 
@@ -0,0 +1,60 @@
+import threading
+import flask
+
+############################################################
+#  Warmup of the lazily imported libraries
+############################################################
+# The app imports pandas, NumPy, Pillow fonts, openpyxl and the plotly figure classes only when a callback
+# first needs them, so that a worker starts serving (and /healthz answers) without waiting for them.
+# warmup() imports and touches them ahead of the first request:
+#   "preload":    in the gunicorn master before the workers are forked (the memory is shared by the workers)
+#   "background": in a thread of each worker after it has started (see gunicorn.conf.py). Each worker imports
+#                 and keeps its own copy; /healthz answers 503 until it has finished.
+#   "off":        on first use only
+#
+# The background jobs are forked from the worker. A fork while the warmup thread holds a lock (e.g. an import
+# lock) would leave the job blocked, so the jobs wait for done (see background.py).
+done = threading.Event()
+done.set()
+
+def warmup():
+    # The modules used by the callbacks (pandas, NumPy, Pillow, plotly)
+    import numpy as np
+    import pandas as pd
+    import plotly.graph_objs as go
+    import dataset_store
+    import data_loader
+    import normalization
+    import signal_graph
+    import render
+    import band_plot_utils
+    import glyph_cache
+
+    # The validators of the figure and trace properties are loaded when the objects are first built.
+    go.Figure(go.Scattergl(x = np.zeros(2), y = np.zeros(2)))
+    # openpyxl is imported by pandas at the first .xlsx upload / export.
+    import openpyxl
+    # Fonts of the labels
+    for font_size in {render.default_values["lane_label_size"], render.default_values["mw_label_size"]}:
+        glyph_cache.get_metrics(font_size)
+        glyph_cache.get_glyph(font_size, "0", (0.0, 0.0))
+
+def run():
+    try:
+        warmup()
+    finally:
+        done.set()
+
+def init_server(server: flask.Flask, exempt_paths = ("/healthz", "/metrics")):
+    # The requests wait until the warmup thread has finished: a module being imported by it is already in
+    # sys.modules, and plotly takes pandas from there when it encodes a response (partially initialized).
+    # The health check and the metrics do not use the libraries, so they are answered at once.
+    @server.before_request
+    def wait_for_warmup():
+        if flask.request.path not in exempt_paths:
+            done.wait()
+
+def start():
+    # Runs warmup() in a daemon thread.
+    done.clear()
+    threading.Thread(target = run, name = "warmup", daemon = True).start()